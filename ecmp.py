@@ -41,15 +41,26 @@
 # the load on each link.
 #
 
-import getopt,sys,random,heapq
+import getopt,sys,random,heapq,collections
+import shortestpath
+from topology import ReadTopology, ReadTraffic
 
 ###########################################################
 # Global parameters
 topofile = 'topology.txt'	# default topology file
 matrixfile = 'matrix.txt'	# default matrix file
 digraph = False			# topology specification is a digraph
+backend = 'auto'		# shortest path algorithm, see shortestpath.py
+cachedir = None			# directory of the shortest path cache, None for no cache
+aggregate = False		# split the traffic toward the same destination together
+savefile = None			# file to save the routing matrix, None for not saving
+loadfile = None			# file to load the routing matrix from, None for computing it
+batch = False			# evaluate the traffic matrices in the arguments in a batch
+sweep = False			# evaluate the link loads under every single link failure
+failfile = None			# file of link failure scenarios to evaluate, None for none
+jobs = 1			# number of worker processes to fill the traffic
 
-optlist, userlist = getopt.getopt(sys.argv[1:], 't:m:dh')
+optlist, userlist = getopt.getopt(sys.argv[1:], 't:m:db:c:ar:R:BfF:j:h')
 for opt, optarg in optlist:
 	if opt == '-t':
 		topofile = optarg
@@ -57,130 +68,95 @@ for opt, optarg in optlist:
 		matrixfile = optarg
 	elif opt == '-d':
 		digraph = True
+	elif opt == '-b':
+		if optarg not in shortestpath.backends:
+			print "Unknown shortest path algorithm %s, use one of %s" % (optarg, ", ".join(shortestpath.backends))
+			sys.exit(1)
+		backend = optarg
+	elif opt == '-c':
+		cachedir = optarg
+	elif opt == '-a':
+		aggregate = True
+	elif opt == '-r':
+		savefile = optarg
+	elif opt == '-R':
+		loadfile = optarg
+	elif opt == '-B':
+		batch = True
+	elif opt == '-f':
+		sweep = True
+	elif opt == '-F':
+		failfile = optarg
+	elif opt == '-j':
+		n = int(optarg)
+		if n > 0: jobs = n
 	else:
 		# getopt will fault for other options
 		print "Available options"
 		print " -t file : The topology file in Rocketfuel format, default is topology.txt"
 		print " -m file : The traffic matrix file, default is matrix.txt"
 		print " -d : Treat the topology file as digraph, i.e. each link is unidirectional"
+		print " -b name : Shortest path algorithm, one of %s. Default auto" % ", ".join(shortestpath.backends)
+		print " -c dir : Save the shortest paths toward all destinations in this directory,"
+		print "          or reuse them if already there"
+		print " -a : Split the traffic of all sources toward the same destination in one pass"
+		print " -r file : Save the routing matrix (links x pairs) to this file"
+		print " -R file : Load the routing matrix from this file instead of computing it"
+		print " -B : Batch mode. The traffic matrix files given after the options are"
+		print "      evaluated together with the one in -m against the routing matrix,"
+		print "      and a summary of link loads is printed for each of them"
+		print " -f : Evaluate the link loads under every single link failure"
+		print " -F file : Evaluate the link loads under the link failure scenarios in this"
+		print "           file, one scenario per line as a list of links <node> <node> ..."
+		print " -j num : Number of worker processes to fill the traffic, default 1"
 		print " -h : This help message"
 		sys.exit(1)
 
 ###########################################################
 # Helper functions
-def ReadInput(f1, f2):
-	"""
-	Read in a Rocketfuel format topology file, then a traffic matrix file.
-	By default, we assume all link distances are 1 and capacities are 1 as
-	well unless specified in the topology file. The link specification
-	contains at least the two endpoints refered by the name of nodes.
-	Optionally, the 3rd and 4th argument in the link specification are the
-	length and capacity respectively. This optional part is not in the
-	Rocketfuel's standard.
-	"""
-	print "Reading input file %s" % f1
-	topoFile = open(f1, "r")	# Topology file
-	nodes = []	# names of nodes
-	links = []	# links as an ordered pair of node IDs
-	length = []	# lengths of links
-	capacity = []	# link capacities
-	nodeDic = {}	# reverse lookup for node ID
-	for line in topoFile:
-		token = line.split()
-		if (len(token) < 2): continue
-		if token[0] == "N":	# specifying a node by its name
-			nodeDic[token[1]] = len(nodes)
-			nodes.append(token[1])
-		elif token[0] == "l":	# specifying a link as a connection between two nodes
-			e = (nodeDic[token[1]], nodeDic[token[2]])
-			links.append(e)
-			length.append(1 if len(token) < 4 else token[3])
-			capacity.append(1 if len(token) < 5 else token[4])
-			if not digraph:
-				links.append((e[1],e[0]))
-				length.append(length[-1])
-				capacity.append(capacity[-1])
-	topoFile.close()
-
-	print "Reading input file %s" % f2
-	trafficFile = open(f2, "r")	# Traffic matrix file
-	traffic = {}
-	for line in trafficFile:
-		token = line.split()
-		if (len(token) < 3): continue
-		traffic[nodeDic[token[0]], nodeDic[token[1]]] = float(token[2])
-	trafficFile.close()
-	return nodes, links, length, capacity, traffic
-
-class memoized(object):
-	"""
-	Copied from http://wiki.python.org/moin/PythonDecoratorLibrary
-	Decorator that caches a function's return value each time it is called.
-	If called later with the same arguments, the cached value is returned,
-	and not re-evaluated.
-	"""
-	def __init__(self, func):
-		self.func = func
-		self.cache = {}
-	def __call__(self, *args):
-		try:
-			return self.cache[args]
-		except KeyError:
-			value = self.func(*args)
-			self.cache[args] = value
-			return value
-		except TypeError:
-			# uncachable -- for instance, passing a list as an argument.
-			# Better to not cache than to blow up entirely.
-			return self.func(*args)
-	def __repr__(self):
-		"""Return the function's docstring."""
-		return self.func.__doc__
-	def __get__(self, obj, objtype):
-		"""Support instance methods."""
-		return functools.partial(self.__call__, obj)
-
-@memoized
-def BellmanFord(t):
-	"""
-	Use Bellman-Ford to deduce the shortest path tree of any node to t
-	"""
-	d = [float('inf') for i in nodes]	# Shortest distance to t
-	n = [-1 for i in nodes]			# Next hop toward t
-	d[t] = 0
-	for i in range(len(nodes)-1):
-		nochange = True
-		for j,(u,v) in enumerate(links):
-			if d[u] > d[v] + length[j]:
-				nochange = False
-				d[u] = d[v] + length[j] 
-				n[u] = v
-		if nochange: break
-	return n,d
-
-###########################################################
-# Step 1:
-#   Read in data
-nodes, links, length, capacity, traffic = ReadInput(topofile, matrixfile)
-
-###########################################################
-# Step 2:
-#   Path-finding for each pair in the traffic matrix
-#   For the traffic between (s,t), it first find the shortest-path tree to t
-#   using Bellman-Ford algorithm. Then we put the full load at node s, and
-#   recursively split this load evenly to each of the next hop toward t.
+def FillDestination(t, demand, linkload, dist=None, hops=None, sign=1, used=None):
+	"""
+	Distribute the traffic from all sources toward destination t on the
+	ECMP shortest-path DAG at once. The demand is a dictionary of source
+	node to the traffic size. The load arriving at each node is split
+	evenly to its next hops toward t, visiting the nodes in descending
+	order of distance to t so that a node is visited only after all its
+	upstream nodes. The resulting link loads, multiplied by sign, are added
+	to linkload, which is a list or a defaultdict. The distances and
+	next hops toward t are looked up unless provided. If used is a set,
+	the links that carry a non-zero share of the demand are added to it.
+	Return the amount of demand that cannot reach t.
+	"""
+	if dist is None: tree, dist = ShortestPath(t)
+	if hops is None: hops = ShortestPath.NextHops(t)
+	load = [0 for i in nodes]
+	for s in demand:
+		load[s] += demand[s]
+	dropped = sum(demand[s] for s in demand if s != t and not hops[s])
+	order = sorted((n for n in range(len(nodes)) if hops[n]), key=lambda n:dist[n], reverse=True)
+	for n in order:
+		if not load[n]: continue
+		share = load[n]/len(hops[n])
+		if used is not None: used.update(hops[n])
+		for l in hops[n]:
+			linkload[l] += sign*share
+			load[links[l][1]] += share
+	return dropped
 
-linkload = [0 for l in links]
-pairs = traffic.keys()
-random.shuffle(pairs)
-for pair in pairs:
-	print "Filling " + str(pair)
-	# Find shortest paths tree by Bellman-Ford
+def SplitPair(s, t, size):
+	"""
+	Split the traffic of the given size from s to t evenly at each hop on
+	the ECMP shortest-path DAG. Return a dictionary of link ID to the
+	traffic it carries.
+	"""
+	# Find shortest paths tree
 	#   dist[n] = the distance to destination from node n
 	#   load[n] = traffic arriving node n
-	tree, dist = BellmanFord(pair[1])
-	load = [0 for i in nodes]
-	load[pair[0]] = traffic[pair]
+	#   hops[n] = the links from node n on the shortest paths to destination
+	tree, dist = ShortestPath(t)
+	hops = ShortestPath.NextHops(t)
+	load = {s: size}
+	linkload = {}
 	# Breath-first search from the source node until the destination node
 	#   visited: The visited nodes, initialized to be t as we can stop once
 	#            we reach t
@@ -188,23 +164,228 @@ for pair in pairs:
 	#            priority as the distance to t. We deplete this priority
 	#            queue in descending order of distance to t. Initialized to
 	#            hold node s only.
-	visited = set([pair[1]])
-	tovisit = [(-dist[pair[0]], pair[0])]
+	visited = set([t])
+	tovisit = [(-dist[s], s)]
 	while len(tovisit):
-		# Pick the farthest node to t and look for all its
-		# shortest-path neighbours
+		# Pick the farthest node to t and look up all its
+		# shortest-path next hops
 		d, n = heapq.heappop(tovisit)
 		if n in visited: continue
-		neighbour = list(set(e[1] for e in links if e[0]==n))
-		mindist = min(dist[i] for i in neighbour)
-		minneighbour = [i for i in neighbour if dist[i]==mindist]
+		minlinks = hops[n]
 		# Distribute load evenly to the neighbours
 		visited.add(n)
-		for i in minneighbour:
-			load[i] += load[n]/len(minneighbour)
-			linkid = links.index((n,i))
-			linkload[linkid] += load[n]/len(minneighbour)
+		for linkid in minlinks:
+			i = links[linkid][1]
+			load[i] = load.get(i, 0) + load[n]/len(minlinks)
+			linkload[linkid] = linkload.get(linkid, 0) + load[n]/len(minlinks)
 			heapq.heappush(tovisit,(-dist[i],i))
+	return linkload
+
+def RoutingMatrix(pairs):
+	"""
+	Build the sparse routing matrix of the given list of pairs, which is
+	a scipy.sparse matrix of links x pairs holding the fraction of each
+	pair's traffic carried by each link.
+	"""
+	from scipy.sparse import csc_matrix
+	data, indices, indptr = [], [], [0]
+	for s,t in pairs:
+		fractions = SplitPair(s, t, 1.0)
+		indices.extend(fractions.keys())
+		data.extend(fractions.values())
+		indptr.append(len(indices))
+	return csc_matrix((data, indices, indptr), shape=(len(links), len(pairs)))
+
+def SaveRouting(f, routing, pairs):
+	"""
+	Save the routing matrix and its list of pairs to a numpy .npz file,
+	together with the digest of the topology it is computed on
+	"""
+	import numpy
+	routing = routing.tocsc()
+	# numpy.savez appends .npz to a file name without it, so write to a
+	# file object to keep the name as given
+	saveFile = open(f, 'wb')
+	numpy.savez(saveFile, data=routing.data, indices=routing.indices, indptr=routing.indptr,
+		shape=routing.shape, pairs=numpy.array(pairs, dtype=numpy.int32).reshape(-1,2),
+		digest=topo.digest)
+	saveFile.close()
+
+def LoadRouting(f):
+	"""
+	Load the routing matrix and its list of pairs as saved by SaveRouting()
+	"""
+	import numpy
+	from scipy.sparse import csc_matrix
+	saved = numpy.load(f)
+	if str(saved['digest']) != topo.digest:
+		print "Routing matrix %s is not computed on topology %s" % (f, topofile)
+		sys.exit(1)
+	routing = csc_matrix((saved['data'], saved['indices'], saved['indptr']), shape=tuple(saved['shape']))
+	pairs = [tuple(p) for p in saved['pairs'].tolist()]
+	return routing, pairs
+
+def ReadFailures(f):
+	"""
+	Read in the link failure scenarios, one per line in the format of
+		<node> <node> [<node> <node> ...]
+	which each pair of nodes is a failed link. Unless the topology is a
+	digraph, both directions of a link fail together. Return a list of
+	scenarios, each is a list of link IDs.
+	"""
+	print "Reading input file %s" % f
+	failFile = open(f, "r")	# Failure scenario file
+	scenarios = []
+	for line in failFile:
+		token = line.split()
+		if len(token) < 2: continue
+		failed = []
+		for i in range(0, len(token)-1, 2):
+			u, v = topo.nodeDic[token[i]], topo.nodeDic[token[i+1]]
+			failed.append(topo.LinkId(u,v))
+			if not digraph: failed.append(topo.LinkId(v,u))
+		scenarios.append(failed)
+	failFile.close()
+	return scenarios
+
+def FailureLoad(failed, baseload, demand, users):
+	"""
+	Find the link loads when the links in the list failed are down, given
+	the link loads without failure and the traffic demand grouped by
+	destination. Only the destinations whose traffic flows over a failed
+	link, as looked up from users, are recomputed: their traffic
+	is removed from the DAG without failure and distributed on the DAG
+	with the failed links removed. Return the link loads, the number of
+	destinations recomputed and the amount of traffic that cannot be
+	delivered.
+	"""
+	affected = set(t for l in failed for t in users[l])
+	delta = collections.defaultdict(float)
+	dropped = 0
+	if affected:
+		failedlength = list(length)
+		for l in failed:
+			failedlength[l] = float('inf')
+	for t in affected:
+		FillDestination(t, demand[t], delta, sign=-1)
+		tree, dist = shortestpath.Dijkstra(topo, t, failedlength)
+		hops = shortestpath.ECMPHops(topo, dist, failed)
+		dropped += FillDestination(t, demand[t], delta, dist, hops)
+	failload = list(baseload)
+	for l, x in delta.iteritems():
+		failload[l] += x
+	return failload, len(affected), dropped
+
+def FillWorker(task):
+	"""
+	Worker process of the parallel fill: Distribute the traffic toward the
+	destinations in the task, and save the resulting link loads into its
+	own row of the shared array.
+	"""
+	w, dests = task
+	load = [0 for l in links]
+	for t in dests:
+		if aggregate:
+			FillDestination(t, demand[t], load)
+		else:
+			for s in demand[t]:
+				for l, x in SplitPair(s, t, demand[t][s]).iteritems():
+					load[l] += x
+	sharedload[w*len(links):(w+1)*len(links)] = load
+	return len(dests)
+
+###########################################################
+# Step 1:
+#   Read in data
+topo = ReadTopology(topofile, digraph)
+if backend == 'bfs' and not topo.UnitLength():
+	print "Shortest path algorithm bfs requires all links of length 1 in %s" % topofile
+	sys.exit(1)
+traffic = ReadTraffic(matrixfile, topo)
+nodes, links, length, capacity = topo.nodes, topo.links, topo.length, topo.capacity
+ShortestPath = shortestpath.ShortestPaths(topo, backend, cachedir)
+if not loadfile and (jobs == 1 or ShortestPath.backend == 'scipy'):
+	# otherwise, the shortest path trees are found by the worker processes,
+	# or not needed for the routing matrix loaded from file
+	ShortestPath.Prefetch(t for s,t in traffic)
+
+###########################################################
+# Step 2:
+#   Path-finding for each pair in the traffic matrix
+#   For the traffic between (s,t), it first find the shortest-path tree to t
+#   using the shortest path algorithm selected by -b. Then we put the full
+#   load at node s, and recursively split this load evenly to each of the
+#   next hop toward t. If -a is specified, the traffic of all sources toward
+#   the same destination is split together in one pass.
+#   If a routing matrix is used (-r, -R or -B), the split fractions of each
+#   pair are put into the matrix instead, and the link loads of each traffic
+#   matrix come from a sparse matrix product.
+#   If -j is specified, the destinations are split across worker processes.
+#   The workers inherit the topology and shortest path data on fork, and each
+#   of them fills its own row of a shared array of link loads, which are
+#   summed up at the end.
+
+linkload = [0 for l in links]
+pairs = traffic.keys()
+random.shuffle(pairs)
+if savefile or loadfile or batch:
+	import numpy
+	matrices = [(matrixfile, traffic)] + [(f, ReadTraffic(f, topo)) for f in (userlist if batch else [])]
+	if loadfile:
+		routing, routepairs = LoadRouting(loadfile)
+	else:
+		routepairs = sorted(set(p for f,m in matrices for p in m))
+		ShortestPath.Prefetch(t for s,t in routepairs)
+		print "Building routing matrix of %d pairs" % len(routepairs)
+		routing = RoutingMatrix(routepairs)
+	if savefile:
+		SaveRouting(savefile, routing, routepairs)
+	# Stack the traffic matrices as columns of the demand array
+	pairindex = dict((p,i) for i,p in enumerate(routepairs))
+	demand = numpy.zeros((len(routepairs), len(matrices)))
+	for m, (f, matrix) in enumerate(matrices):
+		for p, size in matrix.iteritems():
+			if p not in pairindex:
+				print "Pair (%s,%s) in %s is not in the routing matrix" % (nodes[p[0]], nodes[p[1]], f)
+				sys.exit(1)
+			demand[pairindex[p], m] = size
+	loads = routing.dot(demand)	# links x matrices
+	if batch:
+		util = loads / numpy.array(capacity).reshape(-1,1)
+		for m, (f, matrix) in enumerate(matrices):
+			e = links[loads[:,m].argmax()]
+			print "Matrix %s : max load %r on (%s,%s), mean load %r, max utilization %r" % \
+				(f, loads[:,m].max(), nodes[e[0]], nodes[e[1]], loads[:,m].mean(), util[:,m].max())
+	linkload = loads[:,0].tolist()
+	pairs = []
+	aggregate = False
+elif jobs > 1:
+	import multiprocessing
+	demand = {}	# demand[t][s] = traffic from s to t
+	for s,t in pairs:
+		demand.setdefault(t, {})[s] = traffic[s,t]
+	dests = demand.keys()
+	print "Filling %d destinations in %d processes" % (len(dests), jobs)
+	sharedload = multiprocessing.RawArray('d', jobs*len(links))
+	pool = multiprocessing.Pool(jobs)
+	pool.map(FillWorker, [(w, dests[w::jobs]) for w in range(jobs)])
+	pool.close()
+	pool.join()
+	linkload = [sum(sharedload[w*len(links)+l] for w in range(jobs)) for l in range(len(links))]
+	pairs = []
+	aggregate = False
+if aggregate:
+	demand = {}	# demand[t][s] = traffic from s to t
+	for s,t in pairs:
+		demand.setdefault(t, {})[s] = traffic[s,t]
+	for t in demand:
+		print "Filling (*,%d)" % t
+		FillDestination(t, demand[t], linkload)
+	pairs = []
+for pair in pairs:
+	print "Filling " + str(pair)
+	for l, x in SplitPair(pair[0], pair[1], traffic[pair]).iteritems():
+		linkload[l] += x
 
 ###########################################################
 # Step 3:
@@ -212,6 +393,41 @@ for pair in pairs:
 print "Link loads"
 print "\n".join("(%s,%s) = %r" % (nodes[e[0]], nodes[e[1]],linkload[i]) for i,e in sorted(enumerate(links),key=lambda x:linkload[x[0]]))
 
+###########################################################
+# Step 4:
+#   Link failure what-if analysis
+#   The traffic is grouped by destination and filled once without failure.
+#   Then for each failure scenario, only the destinations whose traffic flows
+#   over a failed link are recomputed. A summary line is printed for
+#   each scenario.
+
+if sweep or failfile:
+	scenarios = ReadFailures(failfile) if failfile else []
+	if sweep:
+		step = 1 if digraph else 2
+		scenarios += [range(l, l+step) for l in range(0, len(links), step)]
+	demand = {}	# demand[t][s] = traffic from s to t
+	for s,t in traffic:
+		demand.setdefault(t, {})[s] = traffic[s,t]
+	baseload = [0 for l in links]
+	users = [[] for l in links]	# users[l] = destinations whose traffic flows over link l
+	for t in demand:
+		used = set()
+		FillDestination(t, demand[t], baseload, used=used)
+		for l in used:
+			users[l].append(t)
+	print "Failure scenarios"
+	print "Failed links\tRecomputed\tDropped\tMax load\tMax link\tMax utilization"
+	for failed in scenarios:
+		failload, recomputed, dropped = FailureLoad(failed, baseload, demand, users)
+		for l in failed:
+			failload[l] = 0
+		maxlink = max(range(len(links)), key=lambda l:failload[l])
+		maxutil = max(failload[l]/capacity[l] for l in range(len(links)))
+		failname = " ".join("(%s,%s)" % (nodes[links[l][0]], nodes[links[l][1]]) for l in failed)
+		print "%s\t%d\t%r\t%r\t(%s,%s)\t%r" % (failname, recomputed, dropped, failload[maxlink],
+			nodes[links[maxlink][0]], nodes[links[maxlink][1]], maxutil)
+
 sys.exit(1)
 
 ##################################
@@ -0,0 +1,284 @@
+#
+# Copyright (c) 2011 Polytechnic Institute of New York University
+# Author: Adrian Sai-wah Tam <adrian.sw.tam@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED ''AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE AUTHOR
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation are
+# those of the authors and should not be interpreted as representing official
+# policies, either expressed or implied, of New York University.
+
+
+#
+# Flow event sources for the simulators routeecmp.py and routekpath.py. Each
+# yields the flow arrival/departure events in time order as tuples of
+#     (time, flowID, isArrival, flow spec)
+# where the flow spec is (src,dst,size,begin,end) as in topology.ReadFlows().
+# Events at the same time are ordered by flow ID, then departure before
+# arrival, same as the order of the event heap of ReadFlows().
+#
+# HeapEvents() replays the flows and event heap read by ReadFlows(), which
+# holds all flows in memory. StreamEvents() reads a flow file sorted by begin
+# time lazily and keeps only the pending departures in a calendar queue, so
+# its memory is bounded by the number of concurrent flows.
+#
+# If the path of a flow does not depend on the link loads, the events need not
+# be simulated one by one: PrintTimeline() takes the paths of all flows and
+# prints the same link load changes from sorted numpy arrays, and
+# PrintShardedTimeline() finds the paths in parallel and splits the events into
+# windows of time replayed in parallel by worker processes.
+#
+
+import sys,heapq,multiprocessing
+
+###########################################################
+# Calendar queue
+class CalendarQueue(object):
+	"""
+	A priority queue of tuples keyed by their first element, a time. The
+	time axis is divided into buckets of the given width. Items in future
+	buckets are appended to an unsorted list of their bucket, and only the
+	items of the current bucket are kept in a heap. Pushing and popping
+	cost O(1) amortized plus the log of the size of the current bucket,
+	which is small if the width is comparable to the spacing of the items.
+	The items popped are in the same order as from a heap.
+	"""
+	def __init__(self, width):
+		self.width = width
+		self.current = None	# index of the current bucket
+		self.heap = []		# items in the current bucket or earlier
+		self.buckets = {}	# index of future bucket -> its items
+		self.indices = []	# heap of indices of the future buckets
+		self.size = 0
+	def __len__(self):
+		return self.size
+	def Push(self, item):
+		b = int(item[0] // self.width)
+		if self.current is None: self.current = b
+		if b <= self.current:
+			heapq.heappush(self.heap, item)
+		elif b in self.buckets:
+			self.buckets[b].append(item)
+		else:
+			self.buckets[b] = [item]
+			heapq.heappush(self.indices, b)
+		self.size += 1
+	def Peek(self):
+		"""
+		Return the smallest item, or None if the queue is empty
+		"""
+		if not self.heap:
+			if not self.indices: return None
+			self.current = heapq.heappop(self.indices)
+			self.heap = self.buckets.pop(self.current)
+			heapq.heapify(self.heap)
+		return self.heap[0]
+	def Pop(self):
+		"""
+		Remove and return the smallest item
+		"""
+		self.Peek()
+		self.size -= 1
+		return heapq.heappop(self.heap)
+
+###########################################################
+# Event sources
+def HeapEvents(flows, events):
+	"""
+	Yield the events from the flows and the event heap of ReadFlows()
+	"""
+	while events:
+		time, fid, arrival = heapq.heappop(events)
+		yield time, fid, arrival, flows[fid]
+
+def StreamFlows(f, topo):
+	"""
+	Open the flow file and return an iterator reading it lazily, which
+	yields its flows as (flowID, spec) in the same format and with the same
+	flow IDs as ReadFlows(). The flows must be sorted by begin time,
+	otherwise ValueError is raised when an unsorted flow is read.
+	"""
+	print "Reading input file %s" % f
+	return _ReadFlowFile(open(f, "r"), topo)
+
+def _ReadFlowFile(flowFile, topo):
+	fid = 0
+	lastbegin = float('-inf')
+	for line in flowFile:
+		token = line.split()
+		if (len(token) != 5): continue	# Not a flow specification
+		begin, end = float(token[3]), float(token[4])
+		if end == begin: continue	# Skip this malformed flow
+		if begin < lastbegin:
+			raise ValueError("Flow file %s is not sorted by begin time at: %s" % (flowFile.name, line.strip()))
+		lastbegin = begin
+		yield fid, (topo.nodeDic[token[0]], topo.nodeDic[token[1]], float(token[2]), begin, end)
+		fid += 1
+	flowFile.close()
+
+def StreamEvents(f, topo, width=1.0):
+	"""
+	Return an iterator of the events of the flows in a flow file sorted by
+	begin time. The file is read one flow ahead of the simulation clock,
+	and the pending departures are kept in a calendar queue with buckets
+	of the given width in seconds.
+	"""
+	return _MergeDepartures(StreamFlows(f, topo), width)
+
+def _MergeDepartures(flows, width):
+	departures = CalendarQueue(width)
+	for fid, spec in flows:
+		# flush the departures before this arrival
+		while departures and departures.Peek()[:2] < (spec[3], fid):
+			time, depfid, depspec = departures.Pop()
+			yield time, depfid, False, depspec
+		yield spec[3], fid, True, spec
+		departures.Push((spec[4], fid, spec))
+	while departures:
+		time, depfid, depspec = departures.Pop()
+		yield time, depfid, False, depspec
+
+###########################################################
+# Batch timeline
+def PrintTimeline(flows, paths, nlinks, chunk=1000000):
+	"""
+	Print the link load changes as "time link load" lines, given the flow
+	specs and the path of each flow as a list of link IDs, the same as an
+	event-driven simulation prints them starting from zero load. The
+	events are processed in chunks of the given number.
+	"""
+	cuts = range(0, 2*len(flows), chunk) + [2*len(flows)]
+	for time, link, after, load in _Sweep(flows, paths, nlinks, cuts):
+		sys.stdout.write("".join("%f\t%d\t%f\n" % row for row in zip(time.tolist(), link.tolist(), after.tolist())))
+
+def _Sweep(flows, paths, nlinks, cuts):
+	"""
+	Sweep the link load changes of the flows in the order of events, and
+	yield for the events between each consecutive positions in cuts the
+	arrays of the time, link and load after each change, followed by the
+	array of link loads after these events. The arrival and departure
+	events are sorted once and expanded into the (time, link, +/-size)
+	changes of their paths. Then the load after each change is a
+	cumulative sum over the changes of the same link in event order. The
+	sums are added sequentially, as in the simulation, so the loads are
+	exactly the same.
+	"""
+	import numpy
+	count = len(flows)
+	begin = numpy.array([f[3] for f in flows])
+	end = numpy.array([f[4] for f in flows])
+	size = numpy.array([f[2] for f in flows])
+	pathlen = numpy.array([len(p) for p in paths], dtype=numpy.intp)
+	pathstart = numpy.zeros(count+1, dtype=numpy.intp)
+	numpy.cumsum(pathlen, out=pathstart[1:])
+	pathlinks = numpy.fromiter((l for p in paths for l in p), dtype=numpy.intp, count=pathstart[-1])
+	# Events are sorted by time, then flow ID, then departure before arrival
+	evtime = numpy.concatenate([begin, end])
+	evfid = numpy.concatenate([numpy.arange(count), numpy.arange(count)])
+	evarrival = numpy.concatenate([numpy.ones(count, dtype=bool), numpy.zeros(count, dtype=bool)])
+	order = numpy.lexsort((evarrival, evfid, evtime))
+	load = numpy.zeros(nlinks)	# link loads carried between chunks
+	for first, last in zip(cuts[:-1], cuts[1:]):
+		events = order[first:last]
+		fid = evfid[events]
+		n = pathlen[fid]
+		# expand each event into the changes on its path, in path order
+		offset = numpy.repeat(pathstart[fid] - numpy.cumsum(n) + n, n) + numpy.arange(n.sum())
+		link = pathlinks[offset]
+		time = numpy.repeat(evtime[events], n)
+		delta = numpy.repeat(numpy.where(evarrival[events], size[fid], -size[fid]), n)
+		# cumulative sums of each link, in event order
+		bylink = numpy.argsort(link, kind='mergesort')
+		sortedlink = link[bylink]
+		groups = numpy.flatnonzero(sortedlink[1:] != sortedlink[:-1]) + 1
+		sums = delta[bylink]
+		if len(sums):
+			for a, b in zip([0] + groups.tolist(), groups.tolist() + [len(sums)]):
+				l = sortedlink[a]
+				sums[a] += load[l]
+				sums[a:b] = numpy.add.accumulate(sums[a:b])
+				load[l] = sums[b-1]
+		after = numpy.empty_like(sums)
+		after[bylink] = sums
+		yield time, link, after, load
+
+###########################################################
+# Sharded timeline
+_shard = None	# state shared with the worker processes by fork
+
+def PrintShardedTimeline(flows, events, flowpath, nlinks, jobs, windows=4):
+	"""
+	Print the link load changes as "time link load" lines, given the flow
+	specs and the event heap of ReadFlows(), and a function flowpath(fid,
+	spec) returning the path of a flow as a list of link IDs. The function
+	must return the same path whichever process calls it, e.g. by drawing
+	from a random stream seeded by the flow ID. The paths of the flows are
+	found by the given number of worker processes, then the events are
+	split into windows of equal number of events, the given number of
+	windows per process. The link loads at the start of each window are
+	found by _Sweep(), so they are exactly those of a serial replay, and
+	each window is replayed by a worker process from these loads. The
+	timelines of the windows are printed in order.
+	"""
+	global _shard
+	events = sorted(events)
+	nwindows = max(1, min(len(events), jobs*windows))
+	cuts = [len(events)*w//nwindows for w in range(nwindows+1)]
+	step = max(1, -(-len(flows)//(jobs*windows)))
+	_shard = (flows, flowpath, step)
+	pool = multiprocessing.Pool(jobs)
+	flowpaths = []
+	for paths in pool.imap(_FindPaths, range(0, len(flows), step)):
+		flowpaths.extend(paths)
+	pool.close()
+	pool.join()
+	starting = [[0 for l in range(nlinks)]]	# link loads at the start of each window
+	for time, link, after, load in _Sweep(flows, flowpaths, nlinks, cuts[:-1]):
+		starting.append(load.tolist())
+	_shard = (flows, events, cuts, starting, flowpaths)
+	pool = multiprocessing.Pool(jobs)
+	for text in pool.imap(_ReplayWindow, range(nwindows)):
+		sys.stdout.write(text)
+	pool.close()
+	pool.join()
+	_shard = None
+
+def _FindPaths(first):
+	flows, flowpath, step = _shard
+	return [flowpath(fid, flows[fid]) for fid in range(first, min(first+step, len(flows)))]
+
+def _ReplayWindow(w):
+	flows, events, cuts, starting, flowpaths = _shard
+	load = starting[w]
+	lines = []
+	for time, fid, arrival in events[cuts[w]:cuts[w+1]]:
+		size = flows[fid][2]
+		if arrival:
+			for l in flowpaths[fid]:
+				load[l] += size
+				lines.append("%f\t%d\t%f\n" % (time, l, load[l]))
+		else:
+			for l in flowpaths[fid]:
+				load[l] -= size
+				lines.append("%f\t%d\t%f\n" % (time, l, load[l]))
+	return "".join(lines)
@@ -42,7 +42,10 @@
 # paths carries 1/k of the load for the pair of node.
 #
 
-import getopt,sys,random,heapq
+import getopt,sys,random,heapq,time,os,cPickle
+import shortestpath
+from topology import ReadTopology, ReadTraffic, memoized
+from loadtree import LoadTree
 
 ###########################################################
 # Global parameters
@@ -51,11 +54,22 @@ matrixfile = 'matrix.txt'	# default matrix file
 k = 4				# maximum number of paths to find for a pair
 shortest = False		# use only shortest path
 digraph = False			# topology specification is a digraph
+backend = 'auto'		# shortest path algorithm, see shortestpath.py
+cachedir = None			# directory of the shortest path cache, None for no cache
 overshoot = 0.25		# percentage of length overshoot (w.r.t. shortest path) tolerated, effective only if shortest==False
 maxpaths = 100			# maximum number of paths to return from the FindPaths function
+generator = 'eppstein'		# algorithm to generate candidate paths, eppstein or yen
+minvector = 16			# min number of candidate paths of a pair to score them with numpy
+jobs = 1			# number of worker processes to find the candidate paths
+lpbound = False			# report the LP lower bound of the max utilization
+timelimit = None		# wall-clock budget in seconds, None for no limit
+maxpasses = None		# max number of fine-tuning passes, None for no limit
+checkpoint = None		# file to save the state periodically, None for not saving
+resumefile = None		# checkpoint file to resume from, None for a fresh start
+saveinterval = 60		# min number of seconds between two periodic checkpoints
 
 #random.seed(1)		# Debug use: Uncomment this line for repeatible random numbers
-optlist, userlist = getopt.getopt(sys.argv[1:], 't:m:k:dso:h')
+optlist, userlist = getopt.getopt(sys.argv[1:], 't:m:k:dso:b:c:g:j:lT:I:C:R:h')
 for opt, optarg in optlist:
 	if opt == '-t':
 		topofile = optarg
@@ -66,6 +80,36 @@ for opt, optarg in optlist:
 		if n > 0: k = n
 	elif opt == '-d':
 		digraph = True
+	elif opt == '-b':
+		if optarg not in shortestpath.backends:
+			print "Unknown shortest path algorithm %s, use one of %s" % (optarg, ", ".join(shortestpath.backends))
+			sys.exit(1)
+		backend = optarg
+	elif opt == '-c':
+		cachedir = optarg
+	elif opt == '-g':
+		if optarg not in ['eppstein', 'yen']:
+			print "Unknown candidate path generator %s, use eppstein or yen" % optarg
+			sys.exit(1)
+		generator = optarg
+	elif opt == '-j':
+		n = int(optarg)
+		if n > 0: jobs = n
+	elif opt == '-l':
+		try:
+			import numpy, scipy.optimize, scipy.sparse
+		except ImportError:
+			print "The -l option requires numpy and scipy"
+			sys.exit(1)
+		lpbound = True
+	elif opt == '-T':
+		timelimit = float(optarg)
+	elif opt == '-I':
+		maxpasses = int(optarg)
+	elif opt == '-C':
+		checkpoint = optarg
+	elif opt == '-R':
+		resumefile = optarg
 	elif opt == '-s':
 		shortest = True
 	elif opt == '-o':
@@ -79,6 +123,20 @@ for opt, optarg in optlist:
 		print " -m file : The traffic matrix file, default is matrix.txt"
 		print " -k num : Max number of paths to find for a pair"
 		print " -d : Treat the topology file as digraph, i.e. each link is unidirectional"
+		print " -b name : Shortest path algorithm, one of %s. Default auto" % ", ".join(shortestpath.backends)
+		print " -c dir : Save the shortest paths toward all destinations in this directory,"
+		print "          or reuse them if already there"
+		print " -g name : Candidate path generator, eppstein (default) for Eppstein's k shortest"
+		print "           paths with loops removed, or yen for Yen's k shortest loopless paths"
+		print " -j num : Number of worker processes to find the candidate paths, default 1"
+		print " -l : Report the LP lower bound of the max utilization over the candidate paths,"
+		print "      found by column generation, and the gap of the result to it. Requires"
+		print "      numpy and scipy."
+		print " -T sec : Wall-clock budget. When it is used up, stop with the paths found so far."
+		print "          The first round of path finding always completes."
+		print " -I num : Max number of passes of fine-tuning"
+		print " -C file : Save the state to this file periodically and on exit"
+		print " -R file : Resume from a checkpoint file saved by -C"
 		print " -s : Find only shortest path. The -o option is ignored when this is present."
 		print " -o percent : Percentage of length overshoot w.r.t. shortest path is tolerated."
 		print "              This option is honoured only if -s option is not present. Default 25."
@@ -87,189 +145,524 @@ for opt, optarg in optlist:
 
 ###########################################################
 # Helper functions
-def ReadInput(f1, f2):
-	"""
-	Read in a Rocketfuel format topology file, then a traffic matrix file.
-	By default, we assume all link distances are 1 and capacities are 1 as
-	well unless specified in the topology file. The link specification
-	contains at least the two endpoints refered by the name of nodes.
-	Optionally, the 3rd and 4th argument in the link specification are the
-	length and capacity respectively. This optional part is not in the
-	Rocketfuel's standard.
-	"""
-	print "Reading input file %s" % f1
-	topoFile = open(f1, "r")	# Topology file
-	nodes = []	# names of nodes
-	links = []	# links as an ordered pair of node IDs
-	length = []	# lengths of links
-	capacity = []	# link capacities
-	nodeDic = {}	# reverse lookup for node ID
-	for line in topoFile:
-		token = line.split()
-		if (len(token) < 2): continue
-		if token[0] == "N":	# specifying a node by its name
-			nodeDic[token[1]] = len(nodes)
-			nodes.append(token[1])
-		elif token[0] == "l":	# specifying a link as a connection between two nodes
-			e = (nodeDic[token[1]], nodeDic[token[2]])
-			links.append(e)
-			length.append(1 if len(token) < 4 else token[3])
-			capacity.append(1 if len(token) < 5 else token[4])
-			if not digraph:
-				links.append((e[1],e[0]))
-				length.append(length[-1])
-				capacity.append(capacity[-1])
-	topoFile.close()
-
-	print "Reading input file %s" % f2
-	trafficFile = open(f2, "r")	# Traffic matrix file
-	traffic = {}
-	for line in trafficFile:
-		token = line.split()
-		if (len(token) < 3): continue
-		traffic[nodeDic[token[0]], nodeDic[token[1]]] = float(token[2])
-	trafficFile.close()
-	return nodes, links, length, capacity, traffic
-
-class memoized(object):
-	"""
-	Copied from http://wiki.python.org/moin/PythonDecoratorLibrary
-	Decorator that caches a function's return value each time it is called.
-	If called later with the same arguments, the cached value is returned,
-	and not re-evaluated.
-	"""
-	def __init__(self, func):
-		self.func = func
-		self.cache = {}
-	def __call__(self, *args):
-		try:
-			return self.cache[args]
-		except KeyError:
-			value = self.func(*args)
-			self.cache[args] = value
-			return value
-		except TypeError:
-			# uncachable -- for instance, passing a list as an argument.
-			# Better to not cache than to blow up entirely.
-			return self.func(*args)
-	def __repr__(self):
-		"""Return the function's docstring."""
-		return self.func.__doc__
-	def __get__(self, obj, objtype):
-		"""Support instance methods."""
-		return functools.partial(self.__call__, obj)
-
-@memoized
-def BellmanFord(t):
-	"""
-	Use Bellman-Ford to deduce the shortest path tree of any node to t
-	"""
-	d = [float('inf') for i in nodes]	# Shortest distance to t
-	n = [-1 for i in nodes]			# Next hop toward t
-	d[t] = 0
-	for i in range(len(nodes)-1):
-		nochange = True
-		for j,(u,v) in enumerate(links):
-			if d[u] > d[v] + length[j]:
-				nochange = False
-				d[u] = d[v] + length[j] 
-				n[u] = v
-		if nochange: break
-	return n,d
-
 def ComputeCost(pathlinks):
 	c = max(linkload[l]/capacity[l] for l in pathlinks)
 	return c
 
 def Sidetrack2Path(tree, sidetracks, s, t):
 	"""
-	Given a shortest-path tree toward destination t, and a set of
-	sidetracked edges, deduce the path from s to t.
-	It assumes the sidetracked edges are valid, i.e. no two sidetracked
-	edges are parallel to each other.
+	Given a shortest-path tree toward destination t, and a sequence of
+	sidetracked edges in the order they are taken, deduce the path from s
+	to t. Before each sidetrack, the path follows the shortest-path tree
+	until the tail of the sidetrack is reached. Return an empty list if
+	the path contains a loop.
 	"""
 	visited = set()		# visited nodes
 	path = []		# set of edges
-	sidenodes = set(links[e][0] for e in sidetracks)	# nodes that needs to be sidetracked
 	current = s
-	while current != t:
-		# Loop detection
+	for side in sidetracks + [None]:
+		stop = t if side is None else links[side][0]
+		# proceed according to shortest path tree
+		while current != stop:
+			# Loop detection
+			if current in visited: return []
+			visited.add(current)
+			edge = topo.LinkId(current,tree[current])
+			current = links[edge][1]
+			path.append(edge)
+		if side is None: break
+		# proceed along a sidetrack edge
 		if current in visited: return []
-		# No loop is found yet, proceed one hop
 		visited.add(current)
-		if current in sidenodes:
-			# proceed along a sidetrack edge
-			edge = [e for e in sidetracks if links[e][0] == current]
-		else:
-			# proceed according to shortest path tree
-			edge = [i for i,e in enumerate(links) if e == (current,tree[current])]
-		current = links[edge[0]][1]
-		path.append(edge[0])
+		current = links[side][1]
+		path.append(side)
 	# Destination reached. Return the path
 	return path
 
+def HeapMerge(a, b):
+	"""
+	Merge two persistent leftist heaps. A heap node is a tuple of
+	(key, node, left, right, rank) and None is the empty heap. The heaps a
+	and b are not modified; the nodes on the right spine are copied.
+	"""
+	if a is None: return b
+	if b is None: return a
+	if b[0] < a[0]: a, b = b, a
+	key, v, left, right = a[0], a[1], a[2], HeapMerge(a[3], b)
+	if left is None or left[4] < right[4]: left, right = right, left
+	return (key, v, left, right, 1 if right is None else right[4]+1)
+
+@memoized
+def SidetrackHeaps(t):
+	"""
+	Build the heaps of sidetracks of Eppstein's algorithm for destination t:
+	    hout[v] = sidetracks leaving node v, sorted by delta
+	    htree[v] = persistent heap of the first sidetrack of hout[u] for all
+	               node u on the shortest path tree from v to t, keyed by
+	               delta; it shares structure with htree[tree[v]]
+	    pre, post = the DFS interval labels of the shortest path tree rooted
+	               at t, node a is on the tree path from node b to t if and
+	               only if pre[a] <= pre[b] and post[b] <= post[a]
+	Return the tree, distances, delta of sidetracks, hout, htree, pre and post.
+	"""
+	# In below we have
+	#    tree = the next hop node as in the shortest path tree
+	#    dist = distance from a node (w.r.t. `nodes') to t
+	#    delta = the "delta value" of every sidetrack (w.r.t. `links')
+	#    maxdelta = the largest delta that any source can afford
+	tree, dist = ShortestPath(t)
+	maxdelta = 0 if shortest else max(d for d in dist if d != float('inf'))*overshoot
+	# Group the sidetracks by their tail node from the out-adjacency of the
+	# topology, sorted by delta with random tie-breaking. A sidetrack is a
+	# link not in the tree. A link to a tree child of its tail is kept, as
+	# a later sidetrack may leave the child before the path comes back to
+	# the tail; the paths that do loop are rejected by EppsteinPaths. Those
+	# with delta too large for any source are dropped; in case we limit our
+	# search to only shortest path, only delta=0 sidetracks are used.
+	delta = {}
+	hout = [[] for n in nodes]
+	tiebreak = random.Random((pathseed, t))
+	for u in range(len(nodes)):
+		if u == t or dist[u] == float('inf'): continue
+		sides = []
+		for i in topo.OutLinks(u):
+			v = links[i][1]
+			if v == tree[u] or dist[v] == float('inf'): continue
+			d = length[i] + dist[v] - dist[u]
+			if d > maxdelta: continue
+			delta[i] = d
+			sides.append((d, tiebreak.random(), i))
+		sides.sort()
+		hout[u] = [i for d,r,i in sides]
+	# Build htree in the order of a traversal of the shortest path tree
+	# from t, so that htree[tree[v]] is ready before htree[v]
+	children = [[] for n in nodes]
+	for n in range(len(nodes)):
+		if tree[n] != -1: children[tree[n]].append(n)
+	htree = [None for n in nodes]
+	order = [t]
+	for v in order:
+		parent = None if v == t else htree[tree[v]]
+		if hout[v]:
+			htree[v] = HeapMerge(parent, (delta[hout[v][0]], v, None, None, 1))
+		else:
+			htree[v] = parent
+		order.extend(children[v])
+	# Label the tree nodes with the preorder and postorder numbers of DFS
+	pre = [-1 for n in nodes]
+	post = [-1 for n in nodes]
+	counter = 0
+	stack = [(t, False)]
+	while stack:
+		v, finished = stack.pop()
+		if finished:
+			post[v] = counter
+		else:
+			pre[v] = counter
+			stack.append((v, True))
+			stack.extend((c, False) for c in children[v])
+		counter += 1
+	return tree, dist, delta, hout, htree, pre, post
+
 @memoized
 def FindKPaths(s,t):
 	"""
 	Find k paths joining nodes s and t. The topology is stored in array
 	`links'. The nodes s and t refers to the node sequence numbers with
-	respect to the array `nodes'.
+	respect to the array `nodes'. The paths are returned in non-decreasing
+	order of length, at most `maxpaths' of them, using the generator
+	selected by -g. Each path is a tuple of link IDs so that it can be
+	used as a key in sets and dictionaries.
 	"""
+	if generator == 'yen':
+		return [tuple(p) for p in YenPaths(s,t)]
+	return [tuple(p) for p in EppsteinPaths(s,t)]
 
-	# Eppstein's algorithm for k shortest path. In below we have
-	#    tree = the next hop node as in the shortest path tree
-	#    dist = distance from a node (w.r.t. `nodes') to t
-	#    intree = links (w.r.t. `links') that is in the shortest path tree
-	#    sidetrk = links (w.r.t. `links') that can be a sidetrack
-	#    delta = the "delta value" of every link (w.r.t. `links')
-	#    paths = array to store the paths joining s to t, manipulated with heapq
-	#    leaves = the leave nodes of the heap `paths'
-	tree, dist = BellmanFord(t)
-	intree = [i for i,e in enumerate(links) if tree[e[0]] == e[1]]
-	sidetrk = [i for i,e in enumerate(links) if i not in intree and tree[e[1]] != e[0]]
-	delta = dict([i,length[i]+dist[e[1]]-dist[e[0]]] for i,e in enumerate(links))
-	paths = [(dist[s],[])]
-	leaves = [paths[0]]
-
-	# In case we limit our search to only shortest path, use only delta=0 sidetracks
-	if shortest:
-		sidetrk = [e for e in sidetrk if delta[e]==0]
-	# Find a large number of paths
-	random.shuffle(sidetrk)
-	while True:
-		# In this while-loop, a leaf node from the heap `paths' are
-		# retrieved and a sidetrack edge is added to it to form a new
-		# path. Once a new path is found, add to the heap as a new
-		# leaf node.
-		leafdist, leafside = heapq.heappop(leaves)
-		sidenode = set(links[e][0] for e in leafside)	# nodes that needs to be sidetracked
-		for edge in sidetrk:
-			# no two sidetracked edges are parallel to each other
-			if links[edge][0] in sidenode: continue
-			# avoid too lengthy paths w.r.t. the shortest path
-			currentside = leafside[:] + [edge]
-			if sum(delta[i] for i in currentside) > dist[s]*overshoot: continue
-			# avoid duplicated set of sidetrack edges: sort them in order
-			currentside.sort()
-			if [sides for d, sides in paths if sides == currentside]: continue
-			# Find the path, return empty list if a loop is found
-			currentpath = Sidetrack2Path(tree, currentside, s, t)
-			# Add the path to repository if it is loop-free and contains the new sidetracked edge
-			if set(currentside) <= set(currentpath):
-				newpath = (leafdist + delta[edge], currentside)
-				heapq.heappush(paths, newpath)
-				heapq.heappush(leaves, newpath)
-		# quit if we exhausted all the paths (to avoid poping an empty heap)
-		# or if we enumerated too many paths
-		if len(leaves)==0 or len(paths) >= maxpaths: break
-	# convert paths from sidetrack-based notation to edge-based notation
-	edgepaths = [Sidetrack2Path(tree, p[1], s, t) for p in paths]
+def YenPaths(s,t):
+	"""
+	Find the k shortest loopless paths joining nodes s and t, using Yen's
+	algorithm. The spur paths are found by A* search with the distances of
+	the shortest path tree toward t as the lower bound, and are pruned by
+	the overshoot bound.
+	"""
+	# In below we have
+	#    found = the paths found, in non-decreasing order of length
+	#    candidates = heap of (length, tie-breaker, path) of candidate paths
+	#    seen = the paths in found or candidates, as tuples
+	tree, dist = ShortestPath(t)
+	if dist[s] == float('inf'): return []
+	bound = dist[s] if shortest else dist[s]*(1+overshoot)	# max path length allowed
+	found = [Sidetrack2Path(tree, [], s, t)]
+	candidates = []
+	tiebreak = random.Random((pathseed, s, t))
+	seen = set([tuple(found[0])])
+	while len(found) < maxpaths:
+		prev = found[-1]
+		rootlen = 0
+		for i in range(len(prev)):
+			# The spur node is the i-th node of the previous path. The
+			# spur path must deviate from all found paths sharing the
+			# same root, and must not revisit the nodes in the root.
+			spur = links[prev[i]][0]
+			root = prev[:i]
+			bannedlinks = set(p[i] for p in found if len(p) > i and p[:i] == root)
+			bannednodes = set(links[l][0] for l in root)
+			spurpath = shortestpath.AStar(topo, spur, t, dist, bannednodes, bannedlinks, bound-rootlen)
+			if spurpath is not None:
+				path = root + spurpath[0]
+				if tuple(path) not in seen:
+					seen.add(tuple(path))
+					heapq.heappush(candidates, (rootlen + spurpath[1], tiebreak.random(), path))
+			rootlen += length[prev[i]]
+		if not candidates: break
+		found.append(heapq.heappop(candidates)[2])
+	return found
+
+def EppsteinPaths(s,t):
+	"""
+	Find the k shortest paths joining nodes s and t, using Eppstein's
+	algorithm and discarding the paths with loops.
+	"""
+
+	# Eppstein's algorithm for k shortest path. Every s-t path is the
+	# shortest path tree plus a sequence of sidetracks. The sequences are
+	# enumerated from the path graph, which the nodes are the heap nodes of
+	# htree and hout: From a heap node for sidetrack e,
+	#   (1) a heap child replaces e by a sidetrack of no less delta, and
+	#   (2) the root of htree[head of e] appends a sidetrack after e.
+	# The path graph nodes are visited in non-decreasing total delta with
+	# the priority queue `queue', which holds entries of
+	#   (total delta, heap node, sidetrack sequence)
+	# where a heap node is either ('T', htree node) or ('O', v, i) for the
+	# i-th sidetrack in hout[v], and the sidetrack sequence is a linked list
+	# of (last sidetrack, sequence before it, loop-free, start node).
+	#
+	# Loop detection: the path is made of segments on the shortest path
+	# tree, each goes up the tree from a start node (s or the head of the
+	# previous sidetrack) to the tail of the next sidetrack, or to t for the
+	# last segment. The path is loop-free if and only if no two segments
+	# share a node, and two such segments share a node if and only if the
+	# top of one is on the other, which is an ancestor test with the DFS
+	# interval labels. The loop-free flag of a sequence tells if all the
+	# segments up to its last sidetrack are disjoint; if not, all sequences
+	# extended from it have loops and are never generated.
+	tree, dist, delta, hout, htree, pre, post = SidetrackHeaps(t)
+	if dist[s] == float('inf'): return []
+	bound = dist[s]*overshoot	# max total delta allowed
+	edgepaths = [Sidetrack2Path(tree, [], s, t)]
+	queue = []
+	tiebreak = random.Random((pathseed, s, t))
+	def OnSegment(a, low, high):
+		# tell if node a is on the tree path from low up to high
+		return pre[a] <= pre[low] and post[low] <= post[a] and pre[high] <= pre[a] and post[a] <= post[high]
+	def Extend(edge, rest):
+		# append a sidetrack to a loop-free sequence, check the new
+		# segment against the previous ones
+		low = s if rest is None else links[rest[0]][1]
+		high = links[edge][0]
+		last = rest
+		while last is not None:
+			if OnSegment(links[last[0]][0], low, high) or OnSegment(high, last[3], links[last[0]][0]):
+				return (edge, rest, False, low)
+			last = last[1]
+		return (edge, rest, True, low)
+	def Push(d, heapnode, seq):
+		if d <= bound: heapq.heappush(queue, (d, tiebreak.random(), heapnode, seq))
+	if htree[s] is not None:
+		Push(htree[s][0], ('T', htree[s]), Extend(hout[htree[s][1]][0], None))
+	while queue and len(edgepaths) < maxpaths:
+		d, r, heapnode, seq = heapq.heappop(queue)
+		# convert the sidetrack sequence into a path if it is loop-free,
+		# i.e. the last segment from the head of the last sidetrack to t
+		# does not pass the top of any other segment
+		loopfree = seq[2]
+		sidetracks = []
+		last = seq
+		while last is not None and loopfree:
+			top = links[last[0]][0]
+			if pre[top] <= pre[links[seq[0]][1]] and post[links[seq[0]][1]] <= post[top]:
+				loopfree = False
+			sidetracks.append(last[0])
+			last = last[1]
+		if loopfree:
+			sidetracks.reverse()
+			edgepaths.append(Sidetrack2Path(tree, sidetracks, s, t))
+		# the heap children: replace the last sidetrack
+		e = seq[0]
+		if heapnode[0] == 'T':
+			v = heapnode[1][1]
+			for child in heapnode[1][2:4]:
+				if child is None: continue
+				Push(d - delta[e] + child[0], ('T', child), Extend(hout[child[1]][0], seq[1]))
+			i = 0
+		else:
+			v, i = heapnode[1:]
+		if i+1 < len(hout[v]):
+			Push(d - delta[e] + delta[hout[v][i+1]], ('O', v, i+1), Extend(hout[v][i+1], seq[1]))
+		# the cross edge: append a sidetrack after the last one
+		root = htree[links[e][1]]
+		if root is not None and seq[2]:
+			Push(d + root[0], ('T', root), Extend(hout[root[1]][0], seq))
 	return edgepaths
 
+@memoized
+def CandidateMatrix(s,t):
+	"""
+	Pack the paths of FindKPaths(s,t) into a numpy matrix of link IDs, one
+	row per path. Rows shorter than the longest path are padded with link
+	ID len(links), which refers to a sentinel entry of `utilization' that
+	never wins a maximum. Return the matrix, the array of path lengths,
+	and a dictionary from path to row number.
+	"""
+	paths = FindKPaths(s,t)
+	width = max([1] + [len(p) for p in paths])
+	pad = (len(links),)
+	index = numpy.array([p + pad*(width-len(p)) for p in paths], dtype=numpy.intp)
+	pathlen = numpy.array([sum(length[l] for l in p) for p in paths])
+	row = dict((p,i) for i,p in enumerate(paths))
+	return index, pathlen, row
+
+def BestPaths(pair):
+	"""
+	Amongst the paths of FindKPaths(pair) not yet used for the pair, find
+	those of the min cost according to the cost function, with path length
+	as the tie-breaker. Return them in the order of FindKPaths. With numpy,
+	all paths are scored by one gather of `utilization' over the matrix of
+	CandidateMatrix and a row-wise maximum, unless there are too few paths
+	to pay off the overhead of numpy calls.
+	"""
+	paths = FindKPaths(pair[0], pair[1])
+	if utilization is None or len(paths) < minvector:
+		pathcosts = [(ComputeCost(path), path) for path in paths if path not in usedpaths[pair]]
+		if len(pathcosts) == 0: return []
+		mincost = min(j[0] for j in pathcosts)
+		pathlens = [(sum(length[l] for l in path), path) for cost,path in pathcosts if cost==mincost]
+		minlen = min(j[0] for j in pathlens)
+		return [j[1] for j in pathlens if j[0] == minlen]
+	index, pathlen, row = CandidateMatrix(pair[0], pair[1])
+	if len(paths) == len(usedpaths[pair]): return []
+	cost = utilization[index].max(axis=1)
+	for p in usedpaths[pair]:
+		cost[row[p]] = numpy.inf
+	pool = numpy.flatnonzero(cost == cost.min())
+	if len(pool) > 1:
+		pool = pool[pathlen[pool] == pathlen[pool].min()]
+	return [paths[i] for i in pool]
+
+def KPathWorker(task):
+	"""
+	Worker process of the parallel path finding: Find the candidate paths
+	of all pairs toward one destination, so that the shortest path tree
+	and the sidetrack heaps of the destination are built only once.
+	"""
+	t, sources = task
+	return dict(((s,t), FindKPaths(s,t)) for s in sources)
+
+def AddPath(pair, path):
+	"""
+	Put the path in use for the pair, and index it under each of its links
+	"""
+	allpaths[pair].append(path)
+	usedpaths[pair].add(path)
+	for l in path:
+		linkpaths[l].add(path)
+
+def RemovePath(pair, path):
+	"""
+	Stop using the path for the pair, and remove it from the link index
+	"""
+	allpaths[pair].remove(path)
+	usedpaths[pair].discard(path)
+	for l in path:
+		linkpaths[l].discard(path)
+
+def PathOrder(path):
+	"""
+	Sort key of the paths in use: by the order of their pairs in `pairorder'
+	then by their order in allpaths[pair]
+	"""
+	pair = links[path[0]][0], links[path[-1]][1]
+	return pairorder[pair], allpaths[pair].index(path)
+
+def LowerBound():
+	"""
+	Find a lower bound of the max link utilization of any choice of at
+	most k paths per pair from the candidate paths of FindKPaths, by
+	column generation on the LP of splitting the traffic of each pair
+	arbitrarily over the candidates. The LP starts with the paths in use.
+	As the interior-point method of scipy does not report the dual values,
+	the dual LP is solved instead: a weight w for each link, summing to at
+	most 1, and a value z for each pair, maximizing the sum of z such that
+	z of a pair is at most the traffic times the w/capacity length of each
+	of its paths in the LP. For any such weights, the traffic of each pair
+	times the w/capacity length of its shortest candidate, summed over the
+	pairs, is a lower bound of the full LP. The candidate paths shorter
+	than z are added to the LP until the bound meets the LP optimum within
+	the tolerance. Return the best bound, the number of paths in the LP,
+	and the number of LPs solved.
+	"""
+	from scipy.optimize import linprog
+	from scipy.sparse import csr_matrix
+	pairs = [pair for pair in traffic if allpaths[pair]]
+	columns = [(n,p) for n,pair in enumerate(pairs) for p in allpaths[pair]]
+	inlp = set(columns)
+	bound = 0.0
+	iterations = 0
+	while True:
+		# Variables: weights of the links, then the values of the pairs.
+		# Rows of A_ub: value of the pair less the weighted length of
+		# each path in the LP, then the sum of weights
+		iterations += 1
+		row, col, data = [], [], []
+		for j,(n,p) in enumerate(columns):
+			for l in p:
+				row.append(j)
+				col.append(l)
+				data.append(-traffic[pairs[n]]/capacity[l])
+			row.append(j)
+			col.append(len(links)+n)
+			data.append(1.0)
+		row.extend([len(columns)]*len(links))
+		col.extend(range(len(links)))
+		data.extend([1.0]*len(links))
+		A_ub = csr_matrix((data, (row, col)), shape=(len(columns)+1, len(links)+len(pairs)))
+		b_ub = numpy.zeros(len(columns)+1)
+		b_ub[-1] = 1
+		c = numpy.zeros(len(links)+len(pairs))
+		c[len(links):] = -1
+		bounds = [(0, None)]*len(links) + [(None, None)]*len(pairs)
+		result = linprog(c, A_ub, b_ub, bounds=bounds, method='interior-point', options={'sparse':True})
+		if not result.success:
+			print "Error: LP not solved: %s" % result.message
+			sys.exit(1)
+		optimum = -result.fun
+		weight = numpy.zeros(len(links)+1)
+		weight[:-1] = numpy.maximum(result.x[:len(links)], 0) / capacity
+		value = result.x[len(links):]
+		# Lower bound from the shortest candidate of each pair under the
+		# weights, and the candidates to add to the LP
+		lagrange = 0.0
+		added = 0
+		for n,pair in enumerate(pairs):
+			index = CandidateMatrix(pair[0], pair[1])[0]
+			cost = traffic[pair] * weight[index].sum(axis=1)
+			best = cost.argmin()
+			lagrange += cost[best]
+			p = FindKPaths(pair[0], pair[1])[best]
+			if cost[best] < value[n] - 1e-9 and (n,p) not in inlp:
+				columns.append((n,p))
+				inlp.add((n,p))
+				added += 1
+		bound = max(bound, lagrange / max(1.0, weight[:-1].dot(capacity)))
+		if not added or optimum - bound <= 1e-6 * optimum:
+			return bound, len(columns), iterations
+
+def Elapsed():
+	"""
+	Return the wall-clock seconds spent, including those before resuming
+	"""
+	return time.time() - starttime
+
+def OutOfTime():
+	"""
+	Tell if the wall-clock budget is used up
+	"""
+	return timelimit is not None and Elapsed() >= timelimit
+
+def SaveCheckpoint(phase, rounds, force=False):
+	"""
+	Save the state of the path assignment to the checkpoint file, if
+	saveinterval seconds have passed since the last save or force is set.
+	The phase is 'greedy' or 'tune', and rounds is the number of rounds of
+	Step 2 or passes of Step 3 completed. The file is written through a
+	temporary file so that a crash during the save keeps the last
+	checkpoint intact.
+	"""
+	global lastsave
+	if checkpoint is None: return
+	if not force and time.time() - lastsave < saveinterval: return
+	state = {'digest':topo.digest, 'traffic':traffic, 'k':k, 'candidates':CandidateSettings(),
+		'pathseed':pathseed, 'phase':phase, 'rounds':rounds,
+		'pairs':pairs, 'allpaths':allpaths, 'linkload':list(linkload),
+		'random':random.getstate(), 'elapsed':Elapsed()}
+	f = open(checkpoint + '.tmp', 'wb')
+	cPickle.dump(state, f, cPickle.HIGHEST_PROTOCOL)
+	f.close()
+	os.rename(checkpoint + '.tmp', checkpoint)
+	lastsave = time.time()
+
+def LoadCheckpoint(f):
+	"""
+	Load the state saved by SaveCheckpoint(), and check that it is saved
+	with the same topology, traffic matrix, k and candidate path settings
+	"""
+	print "Reading input file %s" % f
+	checkFile = open(f, 'rb')
+	state = cPickle.load(checkFile)
+	checkFile.close()
+	if state['digest'] != topo.digest or state['traffic'] != traffic or state['k'] != k:
+		print "Checkpoint %s is not saved with topology %s, traffic matrix %s and k=%d" % (f, topofile, matrixfile, k)
+		sys.exit(1)
+	saved, current = state.get('candidates', {}), CandidateSettings()
+	changed = sorted(name for name in current if saved.get(name) != current[name])
+	if changed:
+		print "Checkpoint %s is saved with different candidate path settings: %s" % (f, ", ".join("%s=%r" % (name, saved.get(name)) for name in changed))
+		sys.exit(1)
+	return state
+
+def CandidateSettings():
+	"""
+	Return the settings that decide the candidate paths of FindKPaths, as
+	a dictionary of setting names to values. The backend decides the
+	tie-breaking of the shortest path trees.
+	"""
+	return {'shortest':shortest, 'overshoot':overshoot, 'generator':generator,
+		'maxpaths':maxpaths, 'backend':ShortestPath.backend}
+
+def UpdateUtilization(linkset):
+	"""
+	Refresh the entries of `utilization' for the links in linkset after
+	their loads are changed
+	"""
+	if utilization is None: return
+	for l in linkset:
+		utilization[l] = linkload[l]/capacity[l]
+
 ###########################################################
 # Step 1:
 #   Read in data
-nodes, links, length, capacity, traffic = ReadInput(topofile, matrixfile)
+starttime = lastsave = time.time()
+topo = ReadTopology(topofile, digraph)
+if backend == 'bfs' and not topo.UnitLength():
+	print "Shortest path algorithm bfs requires all links of length 1 in %s" % topofile
+	sys.exit(1)
+traffic = ReadTraffic(matrixfile, topo)
+nodes, links, length, capacity = topo.nodes, topo.links, topo.length, topo.capacity
+# The random tie-breaking in finding the candidate paths of a pair is drawn
+# from its own generator seeded by pathseed and the pair, so that the paths
+# found do not depend on the order or the process they are found in
+ShortestPath = shortestpath.ShortestPaths(topo, backend, cachedir)
+if resumefile is not None:
+	state = LoadCheckpoint(resumefile)
+	pathseed = state['pathseed']
+else:
+	pathseed = random.random()
+if jobs == 1 or ShortestPath.backend == 'scipy':
+	# otherwise, the shortest path trees are found by the worker processes
+	ShortestPath.Prefetch(t for s,t in traffic)
+if jobs > 1:
+	# The candidate paths do not depend on the link loads: Find them in
+	# parallel and keep them in the cache of FindKPaths for Step 2
+	import multiprocessing
+	sources = {}	# sources[t] = nodes s with traffic (s,t)
+	for s,t in traffic:
+		sources.setdefault(t, []).append(s)
+	print "Finding paths toward %d destinations in %d processes" % (len(sources), jobs)
+	pool = multiprocessing.Pool(jobs)
+	for found in pool.imap_unordered(KPathWorker, sources.items()):
+		FindKPaths.cache.update(found)
+	pool.close()
+	pool.join()
 
 ###########################################################
 # Step 2:
@@ -279,54 +672,91 @@ nodes, links, length, capacity, traffic = ReadInput(topofile, matrixfile)
 #   shortest paths). Then we put the full load at node s, and
 #   recursively split this load evenly to each of the next hop toward t.
 
-linkload = [0 for l in links]
+linkload = LoadTree([0 for l in links])
+try:
+	# utilization[l] = linkload[l]/capacity[l], with a sentinel entry at the end
+	import numpy
+	utilization = numpy.zeros(len(links)+1)
+	utilization[-1] = -numpy.inf
+except ImportError:
+	utilization = None
 pairs = traffic.keys()
-allpaths = dict()
-for i in range(k):
+allpaths = dict()	# allpaths[pair] = the paths in use for the pair
+usedpaths = dict()	# usedpaths[pair] = set of allpaths[pair], for membership check
+linkpaths = [set() for l in links]	# linkpaths[l] = paths in use that traverse link l
+startround = 0		# first round of Step 2 to run
+passes = 0		# number of passes of Step 3 completed
+exhausted = False	# the budget is used up
+if resumefile is not None:
+	for pair, paths in state['allpaths'].iteritems():
+		allpaths[pair] = []
+		usedpaths[pair] = set()
+		for p in paths:
+			AddPath(pair, p)
+	linkload = LoadTree(state['linkload'])
+	UpdateUtilization(range(len(links)))
+	pairs = state['pairs']
+	random.setstate(state['random'])
+	starttime = time.time() - state['elapsed']
+	if state['phase'] == 'greedy':
+		startround = state['rounds']
+	else:
+		startround, passes = k, state['rounds']
+	print "Resuming after %d %s of %s" % (state['rounds'], "rounds" if state['phase'] == 'greedy' else "passes", state['phase'])
+for i in range(startround, k):
 	random.shuffle(pairs)
 	for pair in pairs:
-		# Find a set of paths using Eppstein's algorithm
+		if i > 0 and OutOfTime():
+			exhausted = True
+			break
+		# Find a set of paths using Eppstein's algorithm. A pair gets at
+		# most one path per round: those with fewer than i paths are
+		# done, and those with more got theirs in the part of this round
+		# before a resume
 		try:
-			if len(allpaths[pair]) < i: continue
+			if len(allpaths[pair]) != i: continue
 		except KeyError:
 			allpaths[pair] = []
-		paths = [p for p in FindKPaths(pair[0], pair[1]) if p not in allpaths[pair]]
-		if len(paths) == 0: continue
+			usedpaths[pair] = set()
 		# Amongst these paths, find the best one:
 		# Find the min cost according to the cost function, then use
 		# path length as the tie-breaker, then randomly choose one
-		pathcosts = [(ComputeCost(path), path) for path in paths]
-		mincost = min(j[0] for j in pathcosts)
-		pathlens = [(sum(length[l] for l in path), path) for cost,path in pathcosts if cost==mincost]
-		minlen = min(j[0] for j in pathlens)
-		pathpool = [j[1] for j in pathlens if j[0] == minlen]
+		pathpool = BestPaths(pair)
+		if len(pathpool) == 0: continue
 		bestpath = random.choice(pathpool)
 		# Check if we need one more path for this pair
 		if len(allpaths[pair]) == 0:
 			# first path: unconditionally add the path and increase load
-			allpaths[pair].append(bestpath)
+			AddPath(pair, bestpath)
 			for l in bestpath:
 				linkload[l] += traffic[pair];
+			UpdateUtilization(bestpath)
 			pathnode = [nodes[links[bestpath[0]][0]]] + [nodes[links[l][1]] for l in bestpath]
 			print "Path (%s,%s) : %s" % (nodes[pair[0]], nodes[pair[1]], " ".join(pathnode))
 		else:
 			# subsequent paths: compare load between with vs without the bestpath
-			newload = linkload[:]
-			linkset = set()
+			# newload holds the new loads of only the links touched
+			newload = {}
 			for l in [ll for p in allpaths[pair] for ll in p]:
-				newload[l] += traffic[pair] * (1.0/(len(allpaths[pair])+1)-1.0/len(allpaths[pair]))
-				linkset.add(l)
+				newload[l] = newload.get(l, linkload[l]) + traffic[pair] * (1.0/(len(allpaths[pair])+1)-1.0/len(allpaths[pair]))
 			for l in bestpath:
-				newload[l] += traffic[pair]/(len(allpaths[pair])+1)
-				linkset.add(l)
-			oldmax = max(linkload[l] for l in linkset)
-			newmax = max(newload[l] for l in linkset)
+				newload[l] = newload.get(l, linkload[l]) + traffic[pair]/(len(allpaths[pair])+1)
+			oldmax = max(linkload[l] for l in newload)
+			newmax = max(newload.itervalues())
 			if newmax <= oldmax:
 				# add this path if we do not increase the maximum load
-				linkload = newload
-				allpaths[pair].append(bestpath)
+				for l,load in newload.iteritems():
+					linkload[l] = load
+				UpdateUtilization(newload)
+				AddPath(pair, bestpath)
 				pathnode = [nodes[links[bestpath[0]][0]]] + [nodes[links[l][1]] for l in bestpath]
 				print "Path (%s,%s) : %s" % (nodes[pair[0]], nodes[pair[1]], " ".join(pathnode))
+	if exhausted:
+		print "Time budget used up after %d rounds of path finding" % i
+		SaveCheckpoint('greedy', i, True)
+		break
+	print "Elapsed %.3f s: max load %r after %d rounds of path finding" % (Elapsed(), linkload.Max(), i+1)
+	SaveCheckpoint('greedy', i+1)
 
 ###########################################################
 # Step 3:
@@ -334,18 +764,27 @@ for i in range(k):
 #   Try to recursively find the hottest link(s) and get the list of traffic
 #   that traverse them. Then try to find an alternative path for these traffic
 #   such that we can offload part of them from these hottest links. Stop if no
-#   more offloading is possible.
+#   more offloading is possible, or the budget is used up.
 print "Original link loads"
 print "\n".join("(%s,%s) = %r" % (nodes[e[0]], nodes[e[1]],linkload[i]) for i,e in sorted(enumerate(links),key=lambda x:linkload[x[0]]))
-improved = True
+pairorder = dict((pair,i) for i,pair in enumerate(traffic.keys()))
+tuning = not exhausted
+improved = tuning
 while improved:
+	if OutOfTime() or (maxpasses is not None and passes >= maxpasses):
+		exhausted = True
+		break
 	# Find the paths that pass through bottleneck links
-	maxload = max(linkload)
-	hotlinks = [i for i,l in enumerate(linkload) if l==maxload]
-	heavypaths = [p for pair in traffic.keys() for p in allpaths[pair] if set(p) & set(hotlinks)]
+	maxload = linkload.Max()
+	hotlinks = set(linkload.MaxIndices())
+	heavypaths = set(p for l in hotlinks for p in linkpaths[l])
+	heavypaths = sorted(heavypaths, key=PathOrder)
 	improved = False
 	# Find an alternative for each such path
 	for path in heavypaths:
+		if OutOfTime():
+			exhausted = True
+			break
 		# alternative path is selected from the output of FindKPaths(s,t)
 		s,t = links[path[0]][0], links[path[-1]][1]
 		paths = FindKPaths(s,t)
@@ -355,8 +794,8 @@ while improved:
 		# (2) not already used for this pair,
 		# (3) use of this alternative path does not create a new hottest link
 		for p in paths:
-			if set(p) & set(hotlinks): continue
-			if p in allpaths[s,t]: continue
+			if not hotlinks.isdisjoint(p): continue
+			if p in usedpaths[s,t]: continue
 			headroom = maxload - max(linkload[l] for l in p)
 			if len(allpaths[s,t]) < k:
 				if headroom <= traffic[s,t]/(len(allpaths[s,t])+1): continue
@@ -380,13 +819,21 @@ while improved:
 				linkload[l] += traffic[s,t]/len(allpaths[s,t])
 			for l in path:
 				linkload[l] -= traffic[s,t]/len(allpaths[s,t])
-			allpaths[s,t].remove(path)
+			RemovePath((s,t), path)
 			pathnode = [nodes[s]] + [nodes[links[l][1]] for l in path]
 			print "Removed (%s,%s) : %s" % (nodes[s], nodes[t], " ".join(pathnode))
 			pathnode = [nodes[s]] + [nodes[links[l][1]] for l in newpath]
 			print "Added (%s,%s) : %s" % (nodes[s], nodes[t], " ".join(pathnode))
-		allpaths[s,t].append(newpath)
+		AddPath((s,t), newpath)
 		improved = True
+	if exhausted: break
+	passes += 1
+	print "Elapsed %.3f s: max load %r after %d passes of fine-tuning" % (Elapsed(), linkload.Max(), passes)
+	SaveCheckpoint('tune', passes)
+if tuning:
+	if exhausted:
+		print "Budget used up after %d passes of fine-tuning" % passes
+	SaveCheckpoint('tune', passes, True)
 
 
 ###########################################################
@@ -400,4 +847,14 @@ for (pair,paths) in allpaths.iteritems():
 print "Link loads"
 print "\n".join("(%s,%s) = %r" % (nodes[e[0]], nodes[e[1]],linkload[i]) for i,e in sorted(enumerate(links),key=lambda x:linkload[x[0]]))
 
+###########################################################
+# Step 5:
+#   Optionally, compare the result with the LP lower bound
+if lpbound:
+	bound, columns, iterations = LowerBound()
+	maxutil = max(linkload[l]/capacity[l] for l in range(len(links)))
+	print "LP lower bound of max utilization = %r (%d paths, %d LPs solved)" % (bound, columns, iterations)
+	# the bound is found to a tolerance, clip the tiny negative gap of an optimal result
+	print "Max utilization = %r, gap = %.2f%%" % (maxutil, max(0, 100*(maxutil-bound)/bound) if bound > 0 else 0)
+
 sys.exit(1)
@@ -42,8 +42,14 @@
 # provided paths for the corresponding source-destination pair. Then this
 # program output the load of each link when all the traffic are applied.
 #
+# Optionally, this program also draws a number of perturbed traffic matrices,
+# in which each entry is multiplied by a uniformly random value in [0.5,1.5] as
+# in matrixmod.py, and reports the distribution of the maximum, 99-percentile
+# and mean link loads over these samples.
+#
 
-import getopt,sys,re
+import getopt,sys
+from topology import ReadTopology, ReadPaths, ReadTraffic
 
 ###########################################################
 # Global parameters
@@ -51,8 +57,10 @@ topofile = 'topology.txt'	# default topology file
 pathfile = 'path.txt'		# default path file
 matrixfile = 'matrix.txt'	# default matrix file
 digraph = False			# topology specification is a digraph
+samples = 0			# number of perturbed traffic matrices to evaluate
+chunk = 100			# number of perturbed traffic matrices to evaluate at a time
 
-optlist, userlist = getopt.getopt(sys.argv[1:], 't:p:m:dh')
+optlist, userlist = getopt.getopt(sys.argv[1:], 't:p:m:dn:h')
 for opt, optarg in optlist:
 	if opt == '-t':
 		topofile = optarg
@@ -62,6 +70,8 @@ for opt, optarg in optlist:
 		matrixfile = optarg
 	elif opt == '-d':
 		digraph = True
+	elif opt == '-n':
+		samples = int(optarg)
 	else:
 		# getopt will fault for other options
 		print "Available options"
@@ -69,67 +79,18 @@ for opt, optarg in optlist:
 		print " -p file : The path file, default is path.txt"
 		print " -m file : The traffic matrix file, default is matrix.txt"
 		print " -d : Treat the topology file as digraph, i.e. each link is unidirectional"
+		print " -n num : Number of perturbed traffic matrices to evaluate, default 0."
+		print "          Requires numpy and scipy."
 		print " -h : This help message"
 		sys.exit(1)
 
-###########################################################
-# Helper functions
-def ReadInput(f1, f2, f3):
-	"""
-	Read in a Rocketfuel format topology file, then a path file, then a
-	traffic matrix file. We assumed the link specification contains at
-	least the two endpoints refered by the name of nodes.
-	"""
-	print "Reading input file %s" % f1
-	topoFile = open(f1, "r")	# Topology file
-	nodes = []	# names of nodes
-	links = []	# links as an ordered pair of node IDs
-	nodeDic = {}	# reverse lookup for node ID
-	linkDic = {}	# reverse lookup for link ID
-	for line in topoFile:
-		token = line.split()
-		if (len(token) < 2): continue
-		if token[0] == "N":	# specifying a node by its name
-			nodeDic[token[1]] = len(nodes)
-			nodes.append(token[1])
-		elif token[0] == "l":	# specifying a link as a connection between two nodes
-			e = (nodeDic[token[1]], nodeDic[token[2]])
-			linkDic[e] = len(links)
-			links.append(e)
-			if not digraph:
-				linkDic[e[1],e[0]] = len(links)
-				links.append((e[1],e[0]))
-	topoFile.close()
-
-	print "Reading input file %s" % f2
-	pathFile = open(f2, "r")	# Path file
-	paths = {}	# lookup table for a pair to paths
-	pathregex = re.compile(r'\((.*),(.*)\) : (.*)')
-	for line in pathFile:
-		match = pathregex.match(line)
-		if not match: continue
-		s, t, nodepath = nodeDic[match.group(1)], nodeDic[match.group(2)], match.group(3).split()
-		linkpath = [linkDic[nodeDic[nodepath[i]],nodeDic[nodepath[i+1]]] for i in range(len(nodepath)-1)]
-		try:
-			paths[s,t].append(linkpath)
-		except KeyError:
-			paths[s,t] = [linkpath]
-	pathFile.close()
-
-	print "Reading input file %s" % f3
-	trafficFile = open(f3, "r")	# Traffic matrix file
-	traffic = {}
-	for line in trafficFile:
-		token = line.split()
-		if (len(token) < 3): continue
-		traffic[nodeDic[token[0]], nodeDic[token[1]]] = float(token[2])
-	trafficFile.close()
-	return nodes, links, paths, traffic
-
 ###########################################################
 # Step 1:
 #   Read in data
-nodes, links, paths, traffic = ReadInput(topofile, pathfile, matrixfile)
+topo = ReadTopology(topofile, digraph)
+paths = ReadPaths(pathfile, topo)
+traffic = ReadTraffic(matrixfile, topo)
+nodes, links = topo.nodes, topo.links
 
 ###########################################################
 # Step 2:
@@ -149,4 +110,38 @@ for pair in traffic.keys():
 print "Link loads"
 print "\n".join("(%s,%s) = %r" % (nodes[e[0]], nodes[e[1]],linkload[i]) for i,e in sorted(enumerate(links),key=lambda x:linkload[x[0]]))
 
+###########################################################
+# Step 4:
+#   Monte-Carlo evaluation of perturbed traffic matrices
+#   The paths are turned into a sparse incidence matrix of links x pairs holding
+#   the fraction of each pair's traffic on each link. Then a chunk of perturbed
+#   traffic matrices, as columns of a demand array, is applied at once by a
+#   matrix product.
+
+if samples > 0:
+	import numpy
+	from scipy.sparse import csc_matrix
+	pairs = traffic.keys()
+	row, col, data = [], [], []	# (link, pair, fraction) triplets, duplicates are summed
+	for i, pair in enumerate(pairs):
+		numpath = len(paths[pair])
+		for path in paths[pair]:
+			for link in path:
+				row.append(link)
+				col.append(i)
+				data.append(1.0/numpath)
+	incidence = csc_matrix((data, (row, col)), shape=(len(links), len(pairs)))
+	demand = numpy.array([traffic[pair] for pair in pairs]).reshape(-1,1)
+	stats = []	# (max, p99, mean) link load of each sample
+	for n in range(0, samples, chunk):
+		scale = 0.5 + numpy.random.random_sample((len(pairs), min(chunk, samples-n)))
+		loads = incidence.dot(demand * scale)	# links x samples
+		stats.append(numpy.vstack([loads.max(axis=0), numpy.percentile(loads, 99, axis=0), loads.mean(axis=0)]))
+	stats = numpy.hstack(stats)
+	print "Link loads over %d perturbed traffic matrices" % samples
+	print "%-12s %12s %12s %12s %12s %12s %12s" % ("", "min", "mean", "p50", "p95", "p99", "max")
+	for name, row in zip(["max load", "p99 load", "mean load"], stats):
+		print "%-12s %12f %12f %12f %12f %12f %12f" % (name, row.min(), row.mean(),
+			numpy.percentile(row, 50), numpy.percentile(row, 95), numpy.percentile(row, 99), row.max())
+
 sys.exit(1)
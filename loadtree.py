@@ -0,0 +1,179 @@
+#
+# Copyright (c) 2011 Polytechnic Institute of New York University
+# Author: Adrian Sai-wah Tam <adrian.sw.tam@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED ''AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE AUTHOR
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation are
+# those of the authors and should not be interpreted as representing official
+# policies, either expressed or implied, of New York University.
+
+
+#
+# Indexed link loads. The loads are kept in a segment tree so that updating
+# the load of a link costs O(log L) and the maximum or minimum load, and the
+# links holding it, are found without scanning all L links. TopLinks extends it
+# to report the hottest links of a simulation over time.
+#
+
+import sys,heapq
+
+###########################################################
+# Segment tree
+class LoadTree(list):
+	"""
+	A list of link loads with the maximum and minimum maintained in a
+	segment tree. Reading and assigning the load of a link by index is as
+	in a list (other list mutators are not supported), and in addition:
+	    Max(), Min() = the maximum and minimum load
+	    ArgMax(), ArgMin() = a link holding the maximum and minimum load
+	    MaxIndices() = all links holding the maximum load
+	    Largest(n) = the n links of the largest loads, ties broken by link ID
+	"""
+	def __init__(self, values):
+		list.__init__(self, values)
+		self.size = 1
+		while self.size < len(self): self.size *= 2
+		self.maxv = [float('-inf') for i in range(2*self.size)]
+		self.minv = [float('inf') for i in range(2*self.size)]
+		self.maxv[self.size:self.size+len(self)] = self
+		self.minv[self.size:self.size+len(self)] = self
+		for i in range(self.size-1, 0, -1):
+			self.maxv[i] = max(self.maxv[2*i], self.maxv[2*i+1])
+			self.minv[i] = min(self.minv[2*i], self.minv[2*i+1])
+	def __setitem__(self, i, x):
+		list.__setitem__(self, i, x)
+		maxv, minv = self.maxv, self.minv
+		i += self.size
+		maxv[i] = minv[i] = x
+		i //= 2
+		while i:
+			newmax = max(maxv[2*i], maxv[2*i+1])
+			newmin = min(minv[2*i], minv[2*i+1])
+			if maxv[i] == newmax and minv[i] == newmin: break
+			maxv[i], minv[i] = newmax, newmin
+			i //= 2
+	def Max(self):
+		return self.maxv[1]
+	def Min(self):
+		return self.minv[1]
+	def ArgMax(self):
+		i = 1
+		while i < self.size:
+			i = 2*i if self.maxv[2*i] == self.maxv[i] else 2*i+1
+		return i - self.size
+	def ArgMin(self):
+		i = 1
+		while i < self.size:
+			i = 2*i if self.minv[2*i] == self.minv[i] else 2*i+1
+		return i - self.size
+	def MaxIndices(self):
+		found = []
+		stack = [1]
+		while stack:
+			i = stack.pop()
+			if self.maxv[i] != self.maxv[1]: continue
+			if i >= self.size:
+				found.append(i - self.size)
+			else:
+				stack.extend([2*i+1, 2*i])
+		return found
+	def Largest(self, n):
+		found = []
+		heap = [(-self.maxv[1], 1)]
+		while heap and len(found) < n:
+			load, i = heapq.heappop(heap)
+			if i >= self.size + len(self):
+				break	# padding, all links are found
+			elif i >= self.size:
+				found.append(i - self.size)
+			else:
+				heapq.heappush(heap, (-self.maxv[2*i], 2*i))
+				heapq.heappush(heap, (-self.maxv[2*i+1], 2*i+1))
+		return found
+
+###########################################################
+# Hottest links tracker
+class TopLinks(LoadTree):
+	"""
+	Link loads of a simulation, reporting at each point of time only the
+	changes of the hottest links instead of every change of load. The
+	loads are assigned by index as in LoadTree, then Report(time) prints
+	the following lines of "time event link load" about the changes since
+	the last report:
+	    top = a link in the top n links whose load changed, or which has
+	          entered the top n
+	    out = a link which has left the top n
+	    max, min = the new maximum or minimum load and a link holding it
+	    alarm, clear = a link whose utilization, i.e. load over capacity,
+	          has risen to or fallen below the alarm level, if given
+	"""
+	def __init__(self, values, capacity, n, level=None):
+		LoadTree.__init__(self, values)
+		self.capacity = capacity
+		self.n = min(n, len(self))
+		self.level = level
+		self.changed = set()	# links changed since the last report
+		self.top = None		# top n links at the last report
+		self.max = self.min = None	# max and min load at the last report
+		self.alarmed = set()	# links at or above the alarm level
+	def __setitem__(self, i, x):
+		LoadTree.__setitem__(self, i, x)
+		self.changed.add(i)
+	def Report(self, time):
+		lines = []
+		# The top n is searched again only if a changed link was in it or
+		# may enter it, unless it holds all links
+		if self.top is not None and self.n == len(self):
+			for l in sorted(self.changed):
+				lines.append("%f\ttop\t%d\t%f\n" % (time, l, self[l]))
+		elif self.top is None or any(l in self.topset or (-self[l],l) < self.lastkey for l in self.changed):
+			top = self.Largest(self.n)
+			topset = set(top)
+			if self.top is not None:
+				for l in self.top:
+					if l not in topset:
+						lines.append("%f\tout\t%d\t%f\n" % (time, l, self[l]))
+			for l in top:
+				if self.top is None or l in self.changed or l not in self.topset:
+					lines.append("%f\ttop\t%d\t%f\n" % (time, l, self[l]))
+			self.top, self.topset = top, topset
+			if top:
+				self.lastkey = (-self[top[-1]], top[-1])
+		if self.Max() != self.max:
+			self.max = self.Max()
+			lines.append("%f\tmax\t%d\t%f\n" % (time, self.ArgMax(), self.max))
+		if self.Min() != self.min:
+			self.min = self.Min()
+			lines.append("%f\tmin\t%d\t%f\n" % (time, self.ArgMin(), self.min))
+		if self.level is not None:
+			for l in sorted(self.changed):
+				hot = self[l] >= self.level * self.capacity[l]
+				if hot and l not in self.alarmed:
+					self.alarmed.add(l)
+					lines.append("%f\talarm\t%d\t%f\n" % (time, l, self[l]))
+				elif not hot and l in self.alarmed:
+					self.alarmed.discard(l)
+					lines.append("%f\tclear\t%d\t%f\n" % (time, l, self[l]))
+		self.changed.clear()
+		sys.stdout.write("".join(lines))
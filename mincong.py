@@ -0,0 +1,221 @@
+#!/usr/bin/python -u
+#
+# Copyright (c) 2011 Polytechnic Institute of New York University
+# Author: Adrian Sai-wah Tam <adrian.sw.tam@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED ''AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE AUTHOR
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# The views and conclusions contained in the software and documentation are
+# those of the authors and should not be interpreted as representing official
+# policies, either expressed or implied, of New York University.
+
+#
+# This program takes two input files: (1) a Rocketfuel format topology file and
+# (2) traffic matrix file with the format of
+#     <node> <node> <load>
+# where the <node> is the code correspond to the topology file and the <load>
+# is a floating point number.
+#
+# The program finds the minimum congestion, i.e. the max link utilization, at
+# which the traffic matrix can be routed if the traffic of a pair can be split
+# arbitrarily over any paths. It is approximated by the multiplicative weights
+# algorithm of Garg and Konemann for the maximum concurrent flow, as improved by
+# Fleischer and Karakostas: in each phase, the demand toward each destination is
+# routed on the shortest path tree under the link lengths, and the length of a
+# link grows exponentially with its load. The lengths give a lower bound of the
+# min congestion and the average of the routing of all phases is a feasible
+# routing, so the output brackets the optimum within a factor of about 1+3e.
+#
+
+import getopt,sys,math
+import shortestpath
+from topology import ReadTopology, ReadTraffic
+
+###########################################################
+# Global parameters
+topofile = 'topology.txt'	# default topology file
+matrixfile = 'matrix.txt'	# default matrix file
+digraph = False			# topology specification is a digraph
+epsilon = 0.1			# accuracy parameter of the approximation
+
+optlist, userlist = getopt.getopt(sys.argv[1:], 't:m:de:h')
+for opt, optarg in optlist:
+	if opt == '-t':
+		topofile = optarg
+	elif opt == '-m':
+		matrixfile = optarg
+	elif opt == '-d':
+		digraph = True
+	elif opt == '-e':
+		n = float(optarg)
+		if 0 < n < 1: epsilon = n
+	else:
+		# getopt will fault for other options
+		print "Available options"
+		print " -t file : The topology file in Rocketfuel format, default is topology.txt"
+		print " -m file : The traffic matrix file, default is matrix.txt"
+		print " -d : Treat the topology file as digraph, i.e. each link is unidirectional"
+		print " -e num : Accuracy parameter between 0 and 1, default 0.1. The running time"
+		print "          grows with 1/e^2"
+		print " -h : This help message"
+		sys.exit(1)
+
+###########################################################
+# Helper functions
+def RouteTree(t, residual):
+	"""
+	Route the residual demand toward t, a dictionary of source node to the
+	traffic size, on the shortest path tree under the current link lengths.
+	Return a dictionary of link ID to the traffic it carries, and the
+	distances to t.
+	"""
+	tree, dist = shortestpath.Dijkstra(topo, t, length)
+	load = [0 for n in nodes]
+	for s in residual:
+		load[s] += residual[s]
+	flow = {}
+	# lengths are positive: visit a node before its next hop toward t
+	order = sorted((n for n in range(len(nodes)) if tree[n] != -1), key=lambda n:dist[n], reverse=True)
+	for n in order:
+		if not load[n]: continue
+		# amongst parallel links to the next hop, take the shortest one
+		j = min((l for l in topo.OutLinks(n) if links[l][1] == tree[n]), key=lambda l:length[l])
+		flow[j] = flow.get(j, 0) + load[n]
+		load[tree[n]] += load[n]
+	return flow, dist
+
+###########################################################
+# Step 1:
+#   Read in data, group the traffic by destination
+topo = ReadTopology(topofile, digraph)
+traffic = ReadTraffic(matrixfile, topo)
+nodes, links, capacity = topo.nodes, topo.links, topo.capacity
+demand = {}	# demand[t][s] = traffic from s to t
+for (s,t),size in traffic.iteritems():
+	if s != t and size > 0:
+		demand.setdefault(t, {})[s] = size
+
+###########################################################
+# Step 2:
+#   Scale the demand so that its routing on the shortest paths with link
+#   length 1/capacity has congestion 1. The min congestion of the scaled
+#   demand is then at most 1, which bounds the number of phases in Step 3.
+length = [1/c for c in capacity]
+flow = [0 for l in links]
+dropped = 0
+for t in demand:
+	treeflow, dist = RouteTree(t, demand[t])
+	for s in demand[t].keys():
+		if dist[s] == float('inf'):
+			dropped += 1
+			del demand[t][s]
+	for j,f in treeflow.iteritems():
+		flow[j] += f
+if dropped:
+	print "Dropped %d pairs with no path" % dropped
+scale = max(flow[j]/capacity[j] for j in range(len(links)))
+if scale == 0:
+	print "No traffic to route"
+	sys.exit(1)
+for t in demand:
+	for s in demand[t]:
+		demand[t][s] /= scale
+print "Shortest path routing congestion = %r" % scale
+
+###########################################################
+# Step 3:
+#   Multiplicative weights. The link lengths start at delta/capacity and
+#   the algorithm stops when D = sum of capacity*length reaches 1, or when
+#   the congestion of the routing found is within 1+epsilon of the lower
+#   bound. As delta underflows for small epsilon, the lengths are kept as
+#   length*exp(logscale) and renormalized when they grow large. The flows,
+#   bound and congestion are kept in the units of the traffic matrix.
+logscale = -math.log(len(links)/(1-epsilon))/epsilon	# log of delta
+flow = [0 for l in links]	# total traffic routed on each link in all phases
+phases = 0			# number of phases completed
+trees = 0			# number of shortest path trees computed
+lowerbound = 0
+congestion = float('inf')
+stop = False
+while not stop:
+	# In each phase, route the demand toward each destination once
+	phaseflow = flow[:]
+	for t in demand:
+		residual = dict(demand[t])
+		while residual and not stop:
+			treeflow, dist = RouteTree(t, residual)
+			trees += 1
+			# route as much as possible without exceeding the capacity of
+			# any link in this step
+			sigma = min([1.0] + [capacity[j]/f for j,f in treeflow.iteritems()])
+			for j,f in treeflow.iteritems():
+				phaseflow[j] += sigma*f*scale
+				length[j] *= 1 + epsilon*sigma*f/capacity[j]
+			if sigma < 1:
+				residual = dict((s, r*(1-sigma)) for s,r in residual.iteritems())
+			else:
+				residual = {}
+			D = sum(capacity[j]*length[j] for j in range(len(links)))
+			if math.log(D) + logscale >= 0:
+				stop = True
+			elif D > 1e100:
+				length = [l/D for l in length]
+				logscale += math.log(D)
+				D = 1.0
+		if stop: break
+	# For any link lengths, alpha = sum of demand*distance over all pairs,
+	# divided by D, is a lower bound of the min congestion
+	alpha = 0
+	for t in demand:
+		tree, dist = shortestpath.Dijkstra(topo, t, length)
+		trees += 1
+		alpha += sum(demand[t][s]*dist[s] for s in demand[t])
+	lowerbound = max(lowerbound, alpha/D*scale)
+	if stop: break
+	phases += 1
+	flow = phaseflow
+	congestion = max(flow[j]/phases/capacity[j] for j in range(len(links)))
+	print "Phase %d: lower bound %r, congestion %r" % (phases, lowerbound, congestion)
+	if congestion <= (1+epsilon)*lowerbound:
+		stop = True
+	elif congestion < scale/2:
+		# The min congestion of the scaled demand is below 1/2, which
+		# makes the phases many: scale it up so that the routing found
+		# has congestion 1
+		for t in demand:
+			for s in demand[t]:
+				demand[t][s] *= scale/congestion
+		scale = congestion
+
+###########################################################
+# Step 4:
+#   Output result to console. The routing found is the average of the
+#   routing in all completed phases.
+print "Lower bound of min congestion = %r" % lowerbound
+if phases == 0:
+	print "No phase completed"
+	sys.exit(1)
+print "Congestion of the routing found = %r (%d phases, %d shortest path trees)" % (congestion, phases, trees)
+linkload = [flow[j]/phases for j in range(len(links))]
+print "Link loads"
+print "\n".join("(%s,%s) = %r" % (nodes[e[0]], nodes[e[1]],linkload[i]) for i,e in sorted(enumerate(links),key=lambda x:linkload[x[0]]))
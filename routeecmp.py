@@ -44,16 +44,28 @@
 # against time.
 #
 
-import getopt,sys,random,heapq
+import getopt,sys,random,collections
+import shortestpath
+from topology import ReadTopology, ReadFlows
+from loadtree import TopLinks
+from flows import HeapEvents, StreamEvents, PrintTimeline, PrintShardedTimeline
 
 ###########################################################
 # Global parameters
 topofile = 'topology.txt'	# default topology file
 flowfile = 'flow.txt'		# default flow specification file
 digraph = False			# topology specification is a digraph
+backend = 'auto'		# shortest path algorithm, see shortestpath.py
+cachedir = None			# directory of the shortest path cache, None for no cache
+maxtables = 1024		# max number of destinations to keep the next-hop tables of
+stream = False			# read the flow file lazily, it must be sorted by begin time
+batch = False			# find the link load changes of all flows at once by sorting
+jobs = 1			# number of worker processes to replay the flows
+top = 0				# number of hottest links to report, 0 to print all changes
+alarm = None			# utilization level to report the links crossing it
 
 #random.seed(1)		# Debug use: Uncomment this line for repeatible random numbers
-optlist, userlist = getopt.getopt(sys.argv[1:], 't:f:dsh')
+optlist, userlist = getopt.getopt(sys.argv[1:], 't:f:db:c:n:sBj:N:a:h')
 for opt, optarg in optlist:
 	if opt == '-t':
 		topofile = optarg
@@ -61,121 +73,115 @@ for opt, optarg in optlist:
 		flowfile = optarg
 	elif opt == '-d':
 		digraph = True
+	elif opt == '-b':
+		if optarg not in shortestpath.backends:
+			print "Unknown shortest path algorithm %s, use one of %s" % (optarg, ", ".join(shortestpath.backends))
+			sys.exit(1)
+		backend = optarg
+	elif opt == '-c':
+		cachedir = optarg
+	elif opt == '-n':
+		n = int(optarg)
+		if n > 0: maxtables = n
+	elif opt == '-s':
+		stream = True
+	elif opt == '-B':
+		batch = True
+	elif opt == '-j':
+		n = int(optarg)
+		if n > 0: jobs = n
+	elif opt == '-N':
+		n = int(optarg)
+		if n > 0: top = n
+	elif opt == '-a':
+		alarm = float(optarg)
 	else:
 		# getopt will fault for other options
 		print "Available options"
 		print " -t file : The topology file in Rocketfuel format, default is topology.txt"
 		print " -f file : The flow file, default is flow.txt"
 		print " -d : Treat the topology file as digraph, i.e. each link is unidirectional"
+		print " -b name : Shortest path algorithm, one of %s. Default auto" % ", ".join(shortestpath.backends)
+		print " -c dir : Save the shortest paths toward all destinations in this directory,"
+		print "          or reuse them if already there"
+		print " -n num : Max number of destinations to keep the next-hop tables in memory,"
+		print "          default 1024"
+		print " -s : Stream the flow file, which must be sorted by begin time, to keep only the"
+		print "      flows in progress in memory"
+		print " -B : Batch mode. As the path of a flow does not depend on the link loads, all"
+		print "      flows are put on their paths at once and the link load changes are found"
+		print "      by sorting, with the same output. Requires numpy, and all flows are read"
+		print "      into memory"
+		print " -j num : Number of worker processes to replay the flows, each taking a window"
+		print "          of time at a time, default 1. Requires numpy, and all flows are read"
+		print "          into memory"
+		print " -N num : Report only the changes of the num links of the largest loads, and"
+		print "          the max and min link loads, at each point of time as lines of"
+		print "          <time> <top|out|max|min> <link> <load>. -B and -j have no effect"
+		print " -a level : With -N, also report the links whose utilization rises to or falls"
+		print "            below this level, as <time> <alarm|clear> <link> <load>"
 		print " -h : This help message"
 		sys.exit(1)
+if top:
+	batch, jobs = False, 1	# the hottest links are tracked in the event loop
 
 ###########################################################
 # Helper functions
-def ReadInput(f1, f3):
+def NextHopTable(t):
 	"""
-	Read in a Rocketfuel format topology file, and then the flow specification.
-	We assumed the link specification contains at least the two endpoints
-	refered by the name of nodes. Optionally, the 3rd and 4th argument in
-	the link specification are the length and capacity respectively. This
-	optional part is not in the Rocketfuel file.
-	The flow specification is in the following format:
-		<source> <destination> <load> <begin> <end>
-	To mean the flow from source to destination begins and ends at certain
-	time (number of seconds since start) and it is of the size of certain
-	load. The flow can only be routed in one path, no spliting allowed.
+	Return the ECMP next-hop table toward t, which for each node lists one
+	link to each distinct next-hop node on the shortest paths to t, in the
+	order of Topology.Neighbours(). The tables of the most recently used
+	destinations are kept, at most maxtables of them.
 	"""
-	print "Reading input file %s" % f1
-	topoFile = open(f1, "r")	# Topology file
-	nodes = []	# names of nodes
-	links = []	# links as an ordered pair of node IDs
-	length = []	# lengths of links
-	capacity = []	# link capacities
-	nodeDic = {}	# reverse lookup for node ID
-	for line in topoFile:
-		token = line.split()
-		if (len(token) < 2): continue
-		if token[0] == "N":	# specifying a node by its name
-			nodeDic[token[1]] = len(nodes) - 1
-			nodes.append(token[1])
-		elif token[0] == "l":	# specifying a link as a connection between two nodes
-			e = (nodeDic[token[1]], nodeDic[token[2]])
-			links.append(e)
-			length.append(1 if len(token) < 4 else token[3])
-			capacity.append(1 if len(token) < 5 else token[4])
-			if not digraph:
-				links.append((e[1],e[0]))
-				length.append(length[-1])
-				capacity.append(capacity[-1])
-	topoFile.close()
+	try:
+		table = tables.pop(t)
+	except KeyError:
+		table = []
+		for n, hops in enumerate(ShortestPath.NextHops(t, False)):
+			first = {}	# first link to each next-hop node
+			for l in hops:
+				first.setdefault(links[l][1], l)
+			table.append([first[v] for v in topo.Neighbours(n) if v in first])
+		if len(tables) >= maxtables:
+			tables.popitem(last=False)
+	tables[t] = table
+	return table
 
-	print "Reading input file %s" % f3
-	flowFile = open(f3, "r")	# Flow history file
-	flows = []	# flow specs (src,dst,size,begin,end)
-	events = []	# flow arrival/departure events (time, flowID, isArrival)
-	for line in flowFile:
-		token = line.split()
-		if (len(token) != 5): continue	# Not a flow specification
-		begin, end = float(token[3]), float(token[4])
-		if end == begin: continue	# Skip this malformed flow
-		heapq.heappush(events, (begin, len(flows), True))
-		heapq.heappush(events, (end, len(flows), False))
-		spec = (nodeDic[token[0]], nodeDic[token[1]], float(token[2]), begin, end)
-		flows.append(spec)
-	flowFile.close()
-	return nodes, links, length, capacity, flows, events
-
-class memoized(object):
-	"""
-	Copied from http://wiki.python.org/moin/PythonDecoratorLibrary
-	Decorator that caches a function's return value each time it is called.
-	If called later with the same arguments, the cached value is returned,
-	and not re-evaluated.
-	"""
-	def __init__(self, func):
-		self.func = func
-		self.cache = {}
-	def __call__(self, *args):
-		try:
-			return self.cache[args]
-		except KeyError:
-			value = self.func(*args)
-			self.cache[args] = value
-			return value
-		except TypeError:
-			# uncachable -- for instance, passing a list as an argument.
-			# Better to not cache than to blow up entirely.
-			return self.func(*args)
-	def __repr__(self):
-		"""Return the function's docstring."""
-		return self.func.__doc__
-	def __get__(self, obj, objtype):
-		"""Support instance methods."""
-		return functools.partial(self.__call__, obj)
-
-@memoized
-def BellmanFord(t):
+def FlowPath(fid, spec):
 	"""
-	Use Bellman-Ford to deduce the shortest path tree of any node to t
+	Find a path for flow fid on the shortest paths by taking a random next
+	hop at each node. The choices are drawn from a random stream seeded by
+	the flow ID, so that the path does not depend on the order in which
+	the flows are routed. Return the list of link IDs.
 	"""
-
-	d = [float('inf') for i in nodes]	# Shortest distance to t
-	n = [-1 for i in nodes]			# Next hop toward t
-	d[t] = 0
-	for i in range(len(nodes)-1):
-		nochange = True
-		for j,(u,v) in enumerate(links):
-			if d[u] > d[v] + length[j]:
-				nochange = False
-				d[u] = d[v] + length[j] 
-				n[u] = v
-		if nochange: break
-	return n,d
+	rng.seed((flowseed, fid))
+	table = NextHopTable(spec[1])
+	currentnode, t = spec[0], spec[1]
+	path = []
+	while currentnode != t:
+		linkid = rng.choice(table[currentnode])
+		path.append(linkid)
+		currentnode = links[linkid][1]
+	return path
 
 ###########################################################
 # Step 1:
 #   Read in data
-nodes, links, length, capacity, flows, events = ReadInput(topofile, flowfile)
+topo = ReadTopology(topofile, digraph)
+if backend == 'bfs' and not topo.UnitLength():
+	print "Shortest path algorithm bfs requires all links of length 1 in %s" % topofile
+	sys.exit(1)
+nodes, links, length, capacity = topo.nodes, topo.links, topo.length, topo.capacity
+ShortestPath = shortestpath.ShortestPaths(topo, backend, cachedir)
+if stream and not batch and jobs == 1:
+	events = StreamEvents(flowfile, topo)
+else:
+	flows, heap = ReadFlows(flowfile, topo)
+	ShortestPath.Prefetch(f[1] for f in flows)
+	events = HeapEvents(flows, heap)
+flowseed = random.random()	# seed of the random streams of the flows
+rng = random.Random()
 
 ###########################################################
 # Step 2:
@@ -185,39 +191,51 @@ nodes, links, length, capacity, flows, events = ReadInput(topofile, flowfile)
 clock = 0.0
 linkload = [0 for l in links]
 flowpaths = {}	# Dictionary for flow:->set_of_links mapping
+tables = collections.OrderedDict()	# next-hop tables, least recently used first
 for e,l in enumerate(linkload):
 	# print initial link load
-	print "%f\t%d\t%f" % (clock, e, l)
-while events:
-	time, fid, arrival = heapq.heappop(events)
-	if arrival:
-		# Find a path for this flow on the tree generated by Bellman-Ford
-		tree, dist = BellmanFord(flows[fid][1])
-		currentnode = flows[fid][0]
-		path = []
-		clock = time
-		while currentnode != flows[fid][1]:
-			# Find a random next hop on the shortest paths
-			neighbour = list(set(e[1] for e in links if e[0]==currentnode))
-			mindist = min(dist[i] for i in neighbour)
-			minneighbour = [i for i in neighbour if dist[i] == mindist]
-			nextnode = random.choice(minneighbour)
-			# Then look up the link, and distribute traffic to it
-			linkid = [i for i,e in enumerate(links) if e == (currentnode, nextnode)]
-			path.append(linkid[0])
-			linkload[linkid[0]] += flows[fid][2]
-			# Print the upated link load
-			print "%f\t%d\t%f" % (clock, linkid[0], linkload[linkid[0]])
-			currentnode = nextnode
-		# Remember the path
-		flowpaths[fid] = path
-	else:
-		# Retrieve the path for this flow
-		path = flowpaths.pop(fid)
-		clock = time
-		# For each link in the path, decrease the load
-		for l in path:
-			linkload[l] -= flows[fid][2]
-			print "%f\t%d\t%f" % (clock, l, linkload[l])
+	if not top: print "%f\t%d\t%f" % (clock, e, l)
+if batch:
+	# Find the link load changes of all flows at once
+	flowpaths = [FlowPath(fid, spec) for fid, spec in enumerate(flows)]
+	PrintTimeline(flows, flowpaths, len(links))
+elif jobs > 1:
+	PrintShardedTimeline(flows, heap, FlowPath, len(links), jobs)
+elif top:
+	# Track the hottest links instead of printing every change of load
+	linkload = TopLinks(linkload, capacity, top, alarm)
+	for time, fid, arrival, spec in events:
+		if time != clock:
+			linkload.Report(clock)
+			clock = time
+		if arrival:
+			path = flowpaths[fid] = FlowPath(fid, spec)
+			for l in path:
+				linkload[l] += spec[2]
+		else:
+			for l in flowpaths.pop(fid):
+				linkload[l] -= spec[2]
+	linkload.Report(clock)
+else:
+	for time, fid, arrival, spec in events:
+		if arrival:
+			# Find a path for this flow on the shortest paths, and
+			# distribute traffic to its links
+			path = FlowPath(fid, spec)
+			clock = time
+			for l in path:
+				linkload[l] += spec[2]
+				# Print the upated link load
+				print "%f\t%d\t%f" % (clock, l, linkload[l])
+			# Remember the path
+			flowpaths[fid] = path
+		else:
+			# Retrieve the path for this flow
+			path = flowpaths.pop(fid)
+			clock = time
+			# For each link in the path, decrease the load
+			for l in path:
+				linkload[l] -= spec[2]
+				print "%f\t%d\t%f" % (clock, l, linkload[l])
 
 sys.exit(1)
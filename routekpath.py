@@ -44,7 +44,10 @@
 # output the change of link loads against time.
 #
 
-import getopt,sys,random,heapq,re
+import getopt,sys,random
+from topology import ReadTopology, ReadPaths, ReadFlows
+from loadtree import TopLinks
+from flows import HeapEvents, StreamEvents, PrintTimeline, PrintShardedTimeline
 
 ###########################################################
 # Global parameters
@@ -52,8 +55,13 @@ topofile = 'topology.txt'	# default topology file
 pathfile = 'path.txt'		# default path file
 flowfile = 'flow.txt'		# default flow specification file
 digraph = False			# topology specification is a digraph
+stream = False			# read the flow file lazily, it must be sorted by begin time
+batch = False			# find the link load changes of all flows at once by sorting
+jobs = 1			# number of worker processes to replay the flows
+top = 0				# number of hottest links to report, 0 to print all changes
+alarm = None			# utilization level to report the links crossing it
 
-optlist, userlist = getopt.getopt(sys.argv[1:], 't:p:f:dh')
+optlist, userlist = getopt.getopt(sys.argv[1:], 't:p:f:dsBj:N:a:h')
 for opt, optarg in optlist:
 	if opt == '-t':
 		topofile = optarg
@@ -63,6 +71,18 @@ for opt, optarg in optlist:
 		flowfile = optarg
 	elif opt == '-d':
 		digraph = True
+	elif opt == '-s':
+		stream = True
+	elif opt == '-B':
+		batch = True
+	elif opt == '-j':
+		n = int(optarg)
+		if n > 0: jobs = n
+	elif opt == '-N':
+		n = int(optarg)
+		if n > 0: top = n
+	elif opt == '-a':
+		alarm = float(optarg)
 	else:
 		# getopt will fault for other options
 		print "Available options"
@@ -70,78 +90,49 @@ for opt, optarg in optlist:
 		print " -p file : The path file, default is path.txt"
 		print " -f file : The flow file, default is flow.txt"
 		print " -d : Treat the topology file as digraph, i.e. each link is unidirectional"
+		print " -s : Stream the flow file, which must be sorted by begin time, to keep only the"
+		print "      flows in progress in memory"
+		print " -B : Batch mode. As the path of a flow does not depend on the link loads, all"
+		print "      flows are put on their paths at once and the link load changes are found"
+		print "      by sorting, with the same output. Requires numpy, and all flows are read"
+		print "      into memory"
+		print " -j num : Number of worker processes to replay the flows, each taking a window"
+		print "          of time at a time, default 1. Requires numpy, and all flows are read"
+		print "          into memory"
+		print " -N num : Report only the changes of the num links of the largest loads, and"
+		print "          the max and min link loads, at each point of time as lines of"
+		print "          <time> <top|out|max|min> <link> <load>. -B and -j have no effect"
+		print " -a level : With -N, also report the links whose utilization rises to or falls"
+		print "            below this level, as <time> <alarm|clear> <link> <load>"
 		print " -h : This help message"
 		sys.exit(1)
+if top:
+	batch, jobs = False, 1	# the hottest links are tracked in the event loop
 
 ###########################################################
 # Helper functions
-def ReadInput(f1, f2, f3):
+def FlowPath(fid, spec):
 	"""
-	Read in a Rocketfuel format topology file, then a path file, then the
-	flow specification.  We assumed the link specification contains at
-	least the two endpoints refered by the name of nodes. The flow
-	specification is in the following format:
-		<source> <destination> <load> <begin> <end>
-	To mean the flow from source to destination begins and ends at certain
-	time (number of seconds since start) and it is of the size of certain
-	load. The flow can only be routed in one path, no spliting allowed.
+	Pick a path for flow fid at random from the known paths. The choice is
+	drawn from a random stream seeded by the flow ID, so that it does not
+	depend on the order in which the flows are routed.
 	"""
-	print "Reading input file %s" % f1
-	topoFile = open(f1, "r")	# Topology file
-	nodes = []	# names of nodes
-	links = []	# links as an ordered pair of node IDs
-	nodeDic = {}	# reverse lookup for node ID
-	linkDic = {}	# reverse lookup for link ID
-	for line in topoFile:
-		token = line.split()
-		if (len(token) < 2): continue
-		if token[0] == "N":	# specifying a node by its name
-			nodeDic[token[1]] = len(nodes)
-			nodes.append(token[1])
-		elif token[0] == "l":	# specifying a link as a connection between two nodes
-			e = (nodeDic[token[1]], nodeDic[token[2]])
-			linkDic[e] = len(links)
-			links.append(e)
-			if not digraph:
-				linkDic[e[1],e[0]] = len(links)
-				links.append((e[1],e[0]))
-	topoFile.close()
-
-	print "Reading input file %s" % f2
-	pathFile = open(f2, "r")	# Path file
-	paths = {}	# lookup table for a pair to paths
-	pathregex = re.compile(r'\((.*),(.*)\) : (.*)')
-	for line in pathFile:
-		match = pathregex.match(line)
-		if not match: continue
-		s, t, nodepath = nodeDic[match.group(1)], nodeDic[match.group(2)], match.group(3).split()
-		linkpath = [linkDic[nodeDic[nodepath[i]],nodeDic[nodepath[i+1]]] for i in range(len(nodepath)-1)]
-		try:
-			paths[s,t].append(linkpath)
-		except KeyError:
-			paths[s,t] = [linkpath]
-	pathFile.close()
-
-	print "Reading input file %s" % f3
-	flowFile = open(f3, "r")	# Flow history file
-	flows = []	# flow specs (src,dst,size,begin,end)
-	events = []	# flow arrival/departure events (time, flowID, isArrival)
-	for line in flowFile:
-		token = line.split()
-		if (len(token) != 5): continue	# Not a flow specification
-		begin, end = float(token[3]), float(token[4])
-		if end == begin: continue	# Skip this malformed flow
-		heapq.heappush(events, (begin, len(flows), True))
-		heapq.heappush(events, (end, len(flows), False))
-		spec = (nodeDic[token[0]], nodeDic[token[1]], float(token[2]), begin, end)
-		flows.append(spec)
-	flowFile.close()
-	return nodes, links, paths, flows, events
+	rng.seed((flowseed, fid))
+	return rng.choice(paths[spec[0],spec[1]])
 
 ###########################################################
 # Step 1:
 #   Read in data
-nodes, links, paths, flows, events = ReadInput(topofile, pathfile, flowfile)
+topo = ReadTopology(topofile, digraph)
+paths = ReadPaths(pathfile, topo)
+if stream and not batch and jobs == 1:
+	events = StreamEvents(flowfile, topo)
+else:
+	flows, heap = ReadFlows(flowfile, topo)
+	events = HeapEvents(flows, heap)
+nodes, links, capacity = topo.nodes, topo.links, topo.capacity
+flowseed = random.random()	# seed of the random streams of the flows
+rng = random.Random()
 
 ###########################################################
 # Step 2:
@@ -153,25 +144,46 @@ linkload = [0 for l in links]
 flowpaths = {}	# Dictionary for flow:->set_of_links mapping
 for e,l in enumerate(linkload):
 	# print initial link load
-	print "%f\t%d\t%f" % (clock, e, l)
-while events:
-	time, fid, arrival = heapq.heappop(events)
-	if arrival:
-		# Find a path for this flow from the known paths
-		path = random.choice(paths[flows[fid][0],flows[fid][1]])
-		# Remember the path, raise load, print updated link load
-		flowpaths[fid] = path
-		clock = time
-		for l in path:
-			linkload[l] += flows[fid][2]
-			print "%f\t%d\t%f" % (clock, l, linkload[l])
-	else:
-		# Retrieve the path for this flow
-		path = flowpaths.pop(fid)
-		clock = time
-		# For each link in the path, decrease the load
-		for l in path:
-			linkload[l] -= flows[fid][2]
-			print "%f\t%d\t%f" % (clock, l, linkload[l])
+	if not top: print "%f\t%d\t%f" % (clock, e, l)
+if batch:
+	# Find the link load changes of all flows at once
+	flowpaths = [FlowPath(fid, spec) for fid, spec in enumerate(flows)]
+	PrintTimeline(flows, flowpaths, len(links))
+elif jobs > 1:
+	PrintShardedTimeline(flows, heap, FlowPath, len(links), jobs)
+elif top:
+	# Track the hottest links instead of printing every change of load
+	linkload = TopLinks(linkload, capacity, top, alarm)
+	for time, fid, arrival, spec in events:
+		if time != clock:
+			linkload.Report(clock)
+			clock = time
+		if arrival:
+			path = flowpaths[fid] = FlowPath(fid, spec)
+			for l in path:
+				linkload[l] += spec[2]
+		else:
+			for l in flowpaths.pop(fid):
+				linkload[l] -= spec[2]
+	linkload.Report(clock)
+else:
+	for time, fid, arrival, spec in events:
+		if arrival:
+			# Find a path for this flow from the known paths
+			path = FlowPath(fid, spec)
+			# Remember the path, raise load, print updated link load
+			flowpaths[fid] = path
+			clock = time
+			for l in path:
+				linkload[l] += spec[2]
+				print "%f\t%d\t%f" % (clock, l, linkload[l])
+		else:
+			# Retrieve the path for this flow
+			path = flowpaths.pop(fid)
+			clock = time
+			# For each link in the path, decrease the load
+			for l in path:
+				linkload[l] -= spec[2]
+				print "%f\t%d\t%f" % (clock, l, linkload[l])
 
 sys.exit(1)
@@ -0,0 +1,312 @@
+#
+# Copyright (c) 2011 Polytechnic Institute of New York University
+# Author: Adrian Sai-wah Tam <adrian.sw.tam@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED ''AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE AUTHOR
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation are
+# those of the authors and should not be interpreted as representing official
+# policies, either expressed or implied, of New York University.
+
+
+#
+# Shortest-path tree computation toward a destination node t. Every backend
+# returns the pair (n,d) where n[u] is the next hop of node u toward t (-1 if
+# u is t or cannot reach t) and d[u] is the shortest distance from u to t
+# (infinity if unreachable). The backends are:
+#   bellman  = Bellman-Ford, O(VE) per destination
+#   dijkstra = Dijkstra's algorithm with a binary heap, O(E log V)
+#   bfs      = Breadth-first search, O(V+E), valid only if all links are of
+#              length 1
+#   scipy    = scipy.sparse.csgraph, computing all destinations in one call
+#   auto     = bfs if all links are of length 1, dijkstra otherwise
+# The trees toward all destinations can also be saved to a cache directory and
+# memory-mapped in later runs on the same topology.
+#
+
+import heapq
+
+backends = ['auto', 'bellman', 'dijkstra', 'bfs', 'scipy']
+
+def BellmanFord(topo, t):
+	"""
+	Use Bellman-Ford to deduce the shortest path tree of any node to t
+	"""
+	d = [float('inf') for i in topo.nodes]	# Shortest distance to t
+	n = [-1 for i in topo.nodes]			# Next hop toward t
+	d[t] = 0
+	for i in range(len(topo.nodes)-1):
+		nochange = True
+		for j,(u,v) in enumerate(topo.links):
+			if d[u] > d[v] + topo.length[j]:
+				nochange = False
+				d[u] = d[v] + topo.length[j]
+				n[u] = v
+		if nochange: break
+	return n,d
+
+def Dijkstra(topo, t, length=None):
+	"""
+	Use Dijkstra's algorithm to deduce the shortest path tree of any node
+	to t, by scanning the links entering each settled node. Optionally, a
+	list of link lengths can be provided to override the lengths in the
+	topology; a link of infinite length is treated as absent.
+	"""
+	if length is None: length = topo.length
+	d = [float('inf') for i in topo.nodes]	# Shortest distance to t
+	n = [-1 for i in topo.nodes]			# Next hop toward t
+	done = [False for i in topo.nodes]
+	links, instart, inlink = topo.links, topo.instart, topo.inlink
+	d[t] = 0
+	heap = [(0, t)]
+	while heap:
+		dist, v = heapq.heappop(heap)
+		if done[v]: continue
+		done[v] = True
+		for j in inlink[instart[v]:instart[v+1]]:
+			u = links[j][0]
+			newdist = dist + length[j]
+			if newdist < d[u]:
+				d[u] = newdist
+				n[u] = v
+				heapq.heappush(heap, (newdist, u))
+	return n,d
+
+def BFS(topo, t):
+	"""
+	Use breadth-first search to deduce the shortest path tree of any node
+	to t. Valid only if all links are of length 1.
+	"""
+	d = [float('inf') for i in topo.nodes]	# Shortest distance to t
+	n = [-1 for i in topo.nodes]			# Next hop toward t
+	links, instart, inlink = topo.links, topo.instart, topo.inlink
+	d[t] = 0
+	frontier = [t]
+	while frontier:
+		nextfrontier = []
+		for v in frontier:
+			for j in inlink[instart[v]:instart[v+1]]:
+				u = links[j][0]
+				if d[u] == float('inf'):
+					d[u] = d[v] + 1
+					n[u] = v
+					nextfrontier.append(u)
+		frontier = nextfrontier
+	return n,d
+
+def SciPy(topo, dests):
+	"""
+	Use scipy.sparse.csgraph to deduce the shortest path trees toward all
+	the destinations in one call. Returns a dictionary of destination to
+	(n,d) pair.
+	"""
+	from scipy.sparse import csr_matrix
+	from scipy.sparse.csgraph import shortest_path
+	# Build the reversed graph, i.e. an entry at (v,u) for link (u,v), so
+	# that the shortest path from t in it is the shortest path toward t.
+	# Parallel links are reduced to the shortest one.
+	minlen = {}
+	for j,(u,v) in enumerate(topo.links):
+		if (v,u) not in minlen or topo.length[j] < minlen[v,u]:
+			minlen[v,u] = topo.length[j]
+	rows = [e[0] for e in minlen]
+	cols = [e[1] for e in minlen]
+	size = len(topo.nodes)
+	graph = csr_matrix((minlen.values(), (rows, cols)), shape=(size, size))
+	dests = list(dests)
+	dist, pred = shortest_path(graph, directed=True, indices=dests, return_predecessors=True)
+	trees = {}
+	for i,t in enumerate(dests):
+		# predecessor on the path from t in the reversed graph is the
+		# next hop toward t in the original graph
+		n = [int(x) if x >= 0 else -1 for x in pred[i]]
+		d = [float(x) for x in dist[i]]
+		trees[t] = (n,d)
+	return trees
+
+def OnDAG(topo, dist, j):
+	"""
+	Tell if link j is on a shortest path toward the destination, given the
+	distances toward it. For parallel links, only the one in the link index
+	of the topology is used.
+	"""
+	u, v = topo.links[j]
+	return dist[u] == topo.length[j] + dist[v] != float('inf') and topo.linkDic[u,v] == j
+
+def AStar(topo, s, t, h, bannednodes=(), bannedlinks=(), limit=float('inf')):
+	"""
+	Use A* search to find a shortest path from s to t that avoids the
+	banned nodes and links, with h[u] as a lower bound of the distance from
+	u to t, e.g. the distances of a shortest path tree toward t. Paths
+	longer than limit are not explored. Return the path as a list of link
+	IDs and its length, or None if no such path exists.
+	"""
+	links, length = topo.links, topo.length
+	outstart, outlink = topo.outstart, topo.outlink
+	g = {s: 0}		# distance from s
+	prev = {s: -1}		# the link to reach a node
+	done = set()
+	heap = [(h[s], s)]
+	while heap:
+		f, u = heapq.heappop(heap)
+		if u in done: continue
+		if u == t:
+			path = []
+			while prev[u] != -1:
+				path.append(prev[u])
+				u = links[prev[u]][0]
+			path.reverse()
+			return path, g[t]
+		done.add(u)
+		for j in outlink[outstart[u]:outstart[u+1]]:
+			v = links[j][1]
+			if v in bannednodes or j in bannedlinks or v in done: continue
+			newg = g[u] + length[j]
+			if newg + h[v] > limit: continue
+			if v not in g or newg < g[v]:
+				g[v] = newg
+				prev[v] = j
+				heapq.heappush(heap, (newg + h[v], v))
+	return None
+
+def ECMPHops(topo, dist, exclude=()):
+	"""
+	Return the ECMP next hops toward a destination given the distances
+	toward it, as a list which for each node holds the IDs of the links
+	leaving it on a shortest path. Links in exclude are never used.
+	"""
+	hops = [[] for n in topo.nodes]
+	for j in range(len(topo.links)):
+		if j not in exclude and OnDAG(topo, dist, j):
+			hops[topo.links[j][0]].append(j)
+	return hops
+
+class ShortestPaths(object):
+	"""
+	Memoized shortest-path trees toward the destinations, computed with a
+	selectable backend. Calling this object with a destination t returns
+	the (n,d) pair as described above, and NextHops(t) gives the ECMP next
+	hops toward t.
+
+	If a cache directory is given, the distances, next hops and ECMP
+	next-hop link sets toward every destination are computed once and
+	saved there as numpy arrays, keyed by the digest of the topology. Later
+	runs on the same topology memory-map these arrays and read only the
+	rows of the destinations they use.
+	"""
+	def __init__(self, topo, backend='auto', cachedir=None):
+		if backend not in backends:
+			raise ValueError("Unknown shortest path backend %s" % backend)
+		if backend == 'auto':
+			backend = 'bfs' if topo.UnitLength() else 'dijkstra'
+		elif backend == 'bfs' and not topo.UnitLength():
+			raise ValueError("Shortest path backend bfs requires all links of length 1")
+		self.topo = topo
+		self.backend = backend
+		self.cache = {}
+		self.hopcache = {}
+		self.disk = None
+		if cachedir is not None:
+			self.disk = self._OpenCache(cachedir)
+	def __call__(self, t):
+		try:
+			return self.cache[t]
+		except KeyError:
+			if self.disk is not None:
+				dist, tree, dag = self.disk
+				value = (tree[t].tolist(), dist[t].tolist())
+			elif self.backend == 'bellman':
+				value = BellmanFord(self.topo, t)
+			elif self.backend == 'bfs':
+				value = BFS(self.topo, t)
+			elif self.backend == 'scipy':
+				value = SciPy(self.topo, [t])[t]
+			else:
+				value = Dijkstra(self.topo, t)
+			self.cache[t] = value
+			return value
+	def NextHops(self, t, cache=True):
+		"""
+		Return the ECMP next hops toward t, as a list which for each node
+		holds the IDs of the links leaving it on a shortest path to t. The
+		result is memoized unless cache is False, for the callers keeping
+		their own bounded cache.
+		"""
+		try:
+			return self.hopcache[t]
+		except KeyError:
+			topo = self.topo
+			if self.disk is not None:
+				import numpy
+				dist, tree, dag = self.disk
+				hops = [[] for n in topo.nodes]
+				for j in numpy.unpackbits(dag[t])[:len(topo.links)].nonzero()[0]:
+					hops[topo.links[j][0]].append(int(j))
+			else:
+				hops = ECMPHops(topo, self(t)[1])
+			if cache: self.hopcache[t] = hops
+			return hops
+	def Prefetch(self, dests):
+		"""
+		Compute the shortest path trees toward all the destinations
+		given. With the scipy backend, this is done in one call.
+		"""
+		dests = [t for t in set(dests) if t not in self.cache]
+		if not dests or self.disk is not None: return
+		if self.backend == 'scipy':
+			self.cache.update(SciPy(self.topo, dests))
+		else:
+			for t in dests:
+				self(t)
+	def _OpenCache(self, cachedir):
+		"""
+		Open the cache of the all-destination arrays, create it if it does
+		not exist yet. Return the memory-mapped arrays of distances,
+		next hops and bit-packed ECMP link sets, each with one row per
+		destination.
+		"""
+		import os, numpy
+		path = os.path.join(cachedir, self.topo.digest)
+		names = [os.path.join(path, name) for name in ['dist.npy', 'tree.npy', 'dag.npy']]
+		if not all(os.path.exists(name) for name in names):
+			topo = self.topo
+			self.Prefetch(range(len(topo.nodes)))
+			dist = numpy.array([self(t)[1] for t in range(len(topo.nodes))], dtype=numpy.float64)
+			tree = numpy.array([self(t)[0] for t in range(len(topo.nodes))], dtype=numpy.int32)
+			# vectorized OnDAG() for all destinations and links
+			tail = numpy.array([e[0] for e in topo.links], dtype=numpy.int32)
+			head = numpy.array([e[1] for e in topo.links], dtype=numpy.int32)
+			length = numpy.array(topo.length, dtype=numpy.float64)
+			indexed = numpy.array([topo.linkDic[e] == j for j,e in enumerate(topo.links)])
+			dag = (dist[:,tail] == length + dist[:,head]) & numpy.isfinite(dist[:,tail]) & indexed
+			dag = numpy.packbits(dag.astype(numpy.uint8), axis=1)
+			if not os.path.isdir(path): os.makedirs(path)
+			# write to temporary files then rename, so that concurrent
+			# runs never see a partial cache
+			for name, array in zip(names, [dist, tree, dag]):
+				tmpname = "%s.%d.tmp" % (name, os.getpid())
+				tmpfile = open(tmpname, "wb")
+				numpy.save(tmpfile, array)
+				tmpfile.close()
+				os.rename(tmpname, name)
+		return tuple(numpy.load(name, mmap_mode='r') for name in names)
@@ -0,0 +1,253 @@
+#
+# Copyright (c) 2011 Polytechnic Institute of New York University
+# Author: Adrian Sai-wah Tam <adrian.sw.tam@gmail.com>
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# 1. Redistributions of source code must retain the above copyright notice,
+#    this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above copyright notice,
+#    this list of conditions and the following disclaimer in the documentation
+#    and/or other materials provided with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED ''AS IS'' AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND
+# FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE AUTHOR
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS;
+# OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR
+# OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF
+# ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# The views and conclusions contained in the software and documentation are
+# those of the authors and should not be interpreted as representing official
+# policies, either expressed or implied, of New York University.
+
+#
+# Shared input routines for the scripts in this package. The topology file is
+# read into a Topology object, which holds the links in the same order as they
+# appear in the file (with the reverse direction inserted right after each link
+# unless the topology is a digraph), together with:
+#   - compressed-sparse-row (CSR) out- and in-adjacency arrays, so that the
+#     links leaving or entering a node can be found in O(degree), and
+#   - a hash index from an ordered pair of node IDs to the link ID.
+#
+
+import re,heapq,hashlib,functools
+
+###########################################################
+# Topology
+class Topology(object):
+	"""
+	A directed graph read from a Rocketfuel format topology file. The
+	attributes are:
+	    nodes = names of nodes
+	    nodeDic = reverse lookup for node ID
+	    links = links as an ordered pair of node IDs
+	    linkDic = reverse lookup for link ID, for parallel links the first
+	              one in the topology file is used
+	    length = lengths of links, as float
+	    capacity = link capacities, as float
+	    outstart, outlink = CSR out-adjacency: the links leaving node n are
+	              outlink[outstart[n]:outstart[n+1]]
+	    instart, inlink = CSR in-adjacency: the links entering node n are
+	              inlink[instart[n]:instart[n+1]]
+	    digest = hash of the topology file content and the digraph flag,
+	              None if the topology is not read from a file
+	"""
+	def __init__(self, nodes, links, length, capacity, digest=None):
+		self.digest = digest
+		self.nodes = nodes
+		self.nodeDic = dict((name,i) for i,name in enumerate(nodes))
+		self.links = links
+		self.length = length
+		self.capacity = capacity
+		self.linkDic = {}
+		for i,e in enumerate(links):
+			self.linkDic.setdefault(e, i)
+		self.outstart, self.outlink = self._CSR([e[0] for e in links])
+		self.instart, self.inlink = self._CSR([e[1] for e in links])
+
+	def _CSR(self, endpoint):
+		"""
+		Build the CSR index of links grouped by the given endpoint of
+		each link. Links of the same node keep their file order.
+		"""
+		start = [0 for n in range(len(self.nodes)+1)]
+		for n in endpoint:
+			start[n+1] += 1
+		for n in range(len(self.nodes)):
+			start[n+1] += start[n]
+		fill = start[:-1]
+		index = [0 for l in endpoint]
+		for l,n in enumerate(endpoint):
+			index[fill[n]] = l
+			fill[n] += 1
+		return start, index
+
+	def OutLinks(self, n):
+		"""
+		Return the IDs of the links leaving node n
+		"""
+		return self.outlink[self.outstart[n]:self.outstart[n+1]]
+
+	def InLinks(self, n):
+		"""
+		Return the IDs of the links entering node n
+		"""
+		return self.inlink[self.instart[n]:self.instart[n+1]]
+
+	def Neighbours(self, n):
+		"""
+		Return the distinct nodes reachable from node n in one hop
+		"""
+		return list(set(self.links[l][1] for l in self.OutLinks(n)))
+
+	def LinkId(self, u, v):
+		"""
+		Return the link ID of the link from node u to node v
+		"""
+		return self.linkDic[u,v]
+
+	def UnitLength(self):
+		"""
+		Tell if all links are of length 1, i.e. the distance is hop count
+		"""
+		return all(d == 1 for d in self.length)
+
+###########################################################
+# Input routines
+def ReadTopology(f, digraph=False):
+	"""
+	Read in a Rocketfuel format topology file. By default, we assume all
+	link distances are 1 and capacities are 1 as well unless specified in
+	the topology file. The link specification contains at least the two
+	endpoints refered by the name of nodes. Optionally, the 3rd and 4th
+	argument in the link specification are the length and capacity
+	respectively. This optional part is not in the Rocketfuel's standard.
+	"""
+	print "Reading input file %s" % f
+	topoFile = open(f, "r")	# Topology file
+	digest = hashlib.sha1("digraph=%s\n" % digraph)
+	nodes = []	# names of nodes
+	links = []	# links as an ordered pair of node IDs
+	length = []	# lengths of links
+	capacity = []	# link capacities
+	nodeDic = {}	# reverse lookup for node ID
+	for line in topoFile:
+		digest.update(line)
+		token = line.split()
+		if (len(token) < 2): continue
+		if token[0] == "N":	# specifying a node by its name
+			nodeDic[token[1]] = len(nodes)
+			nodes.append(token[1])
+		elif token[0] == "l":	# specifying a link as a connection between two nodes
+			e = (nodeDic[token[1]], nodeDic[token[2]])
+			links.append(e)
+			length.append(1.0 if len(token) < 4 else float(token[3]))
+			capacity.append(1.0 if len(token) < 5 else float(token[4]))
+			if not digraph:
+				links.append((e[1],e[0]))
+				length.append(length[-1])
+				capacity.append(capacity[-1])
+	topoFile.close()
+	return Topology(nodes, links, length, capacity, digest.hexdigest())
+
+def ReadTraffic(f, topo):
+	"""
+	Read in a traffic matrix file with each line in the format of
+		<node> <node> <load>
+	and return a dictionary of (s,t) node ID pairs to the load.
+	"""
+	print "Reading input file %s" % f
+	trafficFile = open(f, "r")	# Traffic matrix file
+	traffic = {}
+	for line in trafficFile:
+		token = line.split()
+		if (len(token) < 3): continue
+		traffic[topo.nodeDic[token[0]], topo.nodeDic[token[1]]] = float(token[2])
+	trafficFile.close()
+	return traffic
+
+def ReadPaths(f, topo):
+	"""
+	Read in the path file as produced by kpath.py, and return a dictionary
+	of (s,t) node ID pairs to the list of paths. Each path is a list of
+	link IDs.
+	"""
+	print "Reading input file %s" % f
+	pathFile = open(f, "r")	# Path file
+	paths = {}	# lookup table for a pair to paths
+	pathregex = re.compile(r'\((.*),(.*)\) : (.*)')
+	nodeDic, linkDic = topo.nodeDic, topo.linkDic
+	for line in pathFile:
+		match = pathregex.match(line)
+		if not match: continue
+		s, t, nodepath = nodeDic[match.group(1)], nodeDic[match.group(2)], match.group(3).split()
+		linkpath = [linkDic[nodeDic[nodepath[i]],nodeDic[nodepath[i+1]]] for i in range(len(nodepath)-1)]
+		try:
+			paths[s,t].append(linkpath)
+		except KeyError:
+			paths[s,t] = [linkpath]
+	pathFile.close()
+	return paths
+
+def ReadFlows(f, topo):
+	"""
+	Read in the flow specification in the following format:
+		<source> <destination> <load> <begin> <end>
+	To mean the flow from source to destination begins and ends at certain
+	time (number of seconds since start) and it is of the size of certain
+	load. Return the list of flow specs and the heap of flow
+	arrival/departure events.
+	"""
+	print "Reading input file %s" % f
+	flowFile = open(f, "r")	# Flow history file
+	flows = []	# flow specs (src,dst,size,begin,end)
+	events = []	# flow arrival/departure events (time, flowID, isArrival)
+	for line in flowFile:
+		token = line.split()
+		if (len(token) != 5): continue	# Not a flow specification
+		begin, end = float(token[3]), float(token[4])
+		if end == begin: continue	# Skip this malformed flow
+		heapq.heappush(events, (begin, len(flows), True))
+		heapq.heappush(events, (end, len(flows), False))
+		spec = (topo.nodeDic[token[0]], topo.nodeDic[token[1]], float(token[2]), begin, end)
+		flows.append(spec)
+	flowFile.close()
+	return flows, events
+
+###########################################################
+# Helper functions
+class memoized(object):
+	"""
+	Copied from http://wiki.python.org/moin/PythonDecoratorLibrary
+	Decorator that caches a function's return value each time it is called.
+	If called later with the same arguments, the cached value is returned,
+	and not re-evaluated.
+	"""
+	def __init__(self, func):
+		self.func = func
+		self.cache = {}
+	def __call__(self, *args):
+		try:
+			return self.cache[args]
+		except KeyError:
+			value = self.func(*args)
+			self.cache[args] = value
+			return value
+		except TypeError:
+			# uncachable -- for instance, passing a list as an argument.
+			# Better to not cache than to blow up entirely.
+			return self.func(*args)
+	def __repr__(self):
+		"""Return the function's docstring."""
+		return self.func.__doc__
+	def __get__(self, obj, objtype):
+		"""Support instance methods."""
+		return functools.partial(self.__call__, obj)